@@ -0,0 +1,85 @@
+import logging
+import re
+
+import bibtexparser
+
+# Fields used by the dblp:paper importer, see MongoDB/dblp_paper.py
+DEFAULT_FIELDS = ("title", "author", "editor", "year", "booktitle", "journal")
+
+ENTRY_START = re.compile(r"^@(\w+)\s*\{\s*([^,\s]+)\s*,", re.MULTILINE)
+FIELD_START = re.compile(r"\s*([\w\-]+)\s*=\s*\{")
+BRACE = re.compile(r"[{}]")
+FIELD_END = re.compile(r"\s*,?")
+ENTRY_END = re.compile(r"\s*\}\s*$")
+LINE_BREAK = re.compile(r"[ \t]*\n\s*")
+
+
+class irregular_entry(Exception):
+    pass
+
+
+def parse_fields(body):
+    """Parse the "name = {value}," fields of one DBLP entry body.
+
+    Only brace-delimited values are handled, anything else (quoted values,
+    bare numbers, macros, escaped braces) raises irregular_entry.
+    """
+    fields = dict()
+    pos = 0
+    while True:
+        m = FIELD_START.match(body, pos)
+        if not m:
+            if ENTRY_END.match(body, pos):
+                return fields
+            raise irregular_entry(body[pos : pos + 40])
+        depth = 1
+        start = m.end()
+        for b in BRACE.finditer(body, start):
+            depth += 1 if b.group() == "{" else -1
+            if depth == 0:
+                break
+        else:
+            raise irregular_entry("unbalanced braces")
+        value = body[start : b.start()]
+        if "\\{" in value or "\\}" in value:
+            raise irregular_entry("escaped braces")
+        # Same as bibtexparser: line breaks are kept, indentation is dropped
+        fields[m.group(1).lower()] = LINE_BREAK.sub("\n", value.strip())
+        pos = FIELD_END.match(body, b.end()).end()
+
+
+def iter_bib_entries(text, fields=DEFAULT_FIELDS):
+    """Yield the entries of a DBLP .bib as bibtexparser-like dicts.
+
+    Entries have ENTRYTYPE, ID and the given fields (all fields if None).
+    DBLP writes one "@type{key," per entry and brace-delimited values, which
+    are parsed here with a few regular expressions. Entries that do not follow
+    that format are handed to bibtexparser instead.
+    """
+    logger = logging.getLogger("bib")
+    if isinstance(text, bytes):
+        text = text.decode("utf-8")
+    starts = list(ENTRY_START.finditer(text))
+    for i, m in enumerate(starts):
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(text)
+        entry_type = m.group(1).lower()
+        try:
+            if entry_type in ("string", "comment", "preamble"):
+                raise irregular_entry(entry_type)
+            values = parse_fields(text[m.end() : end])
+        except irregular_entry as e:
+            logger.debug(f"Parsing [{m.group(2)}] with bibtexparser: {e}")
+            entries = bibtexparser.loads(text[m.start() : end]).entries
+        else:
+            values["ENTRYTYPE"] = entry_type
+            values["ID"] = m.group(2)
+            entries = [values]
+        for entry in entries:
+            if fields is not None:
+                keep = set(fields) | {"ENTRYTYPE", "ID"}
+                entry = {k: v for k, v in entry.items() if k in keep}
+            yield entry
+
+
+def parse_bib(text, fields=DEFAULT_FIELDS):
+    return list(iter_bib_entries(text, fields))
@@ -1,13 +1,33 @@
+import contextlib
+import datetime
+import functools
+import hashlib
 import json
 import logging
+import os
 import re
+import sys
 import time
+from pathlib import Path
 
 import bibtexparser
 import click
 import requests
 from prettytable import PrettyTable
 
+from bib import DEFAULT_FIELDS, parse_bib
+from fetch import fetcher, rewrite_base_url
+from http_cache import http_cache
+
+# MongoDB scripts import their siblings by module name, and Utils from the
+# parent dir
+sys.path.insert(1, str(Path(__file__).resolve().parent.parent / "MongoDB"))
+sys.path.insert(1, str(Path(__file__).resolve().parent.parent))
+from bulk import bulk_writer
+from dblp_paper import dblp_paper_record
+from utils import make_mongodb
+from Utils.utils import option_group
+
 log_format = logging.Formatter(
     "[%(asctime)s][%(filename)s:%(lineno)4s - %(funcName)10s()] %(message)s"
 )
@@ -19,6 +39,8 @@ handler.setFormatter(log_format)
 logging.getLogger().addHandler(handler)
 logging.getLogger().setLevel(logging.INFO)
 
+DEFAULT_CACHE_DIR = str(Path.home() / ".cache" / "mightypc" / "dblp")
+
 
 @click.group()
 def dblp():
@@ -55,11 +77,13 @@ def parse_and_check(tpc_file, erc_file, out_file):
             json.dump(pc, f, ensure_ascii=False, indent=4)
 
 
-def download_single_pc_publication(pc_record):
-    url = f'{pc_record["dblp"]}.bib'
-    responses = requests.get(url)
-    bib = bibtexparser.loads(responses.content)
-    return bib.entries
+def download_single_pc_publication(pc_record, fetch=None, base_url=None):
+    url = rewrite_base_url(f'{pc_record["dblp"]}.bib', base_url)
+    if fetch:
+        content = fetch.get_content(url)
+    else:
+        content = requests.get(url, timeout=30).content
+    return parse_bib(content)
 
 
 def summarize_pc_member(members):
@@ -71,13 +95,67 @@ def summarize_pc_member(members):
     return table
 
 
+# Options shared by the commands downloading from DBLP
+fetch_options = option_group(
+    click.option("-j", "--jobs", type=int, default=4, show_default=True),
+    click.option(
+        "-r",
+        "--rate",
+        type=float,
+        default=1.0,
+        show_default=True,
+        help="Requests/s",
+    ),
+    click.option("--burst", type=int, default=1, show_default=True),
+    click.option("--retries", type=int, default=5, show_default=True),
+    click.option("--base_url", help="Download from this server instead of dblp.org"),
+    click.option("--cache_dir", default=DEFAULT_CACHE_DIR, show_default=True),
+    click.option("--no_cache", is_flag=True),
+    click.option("--offline", is_flag=True, help="Only use cached .bib files"),
+)
+
+
+def make_fetcher(jobs, rate, burst, retries, cache_dir, no_cache, offline):
+    if no_cache and offline:
+        raise Exception("Offline mode needs the cache, remove --no_cache")
+    cache = None if no_cache else http_cache(cache_dir, offline)
+    return fetcher(rate, burst, jobs, retries, cache=cache)
+
+
 @dblp.command()
 @click.option("-p", "--pc_file", required=True)
 @click.option("-n", "--pc_name")
 @click.option("-o", "--out_file", required=True)
 @click.option("-n", "--need_fix_file", default="pc_need_publication.json")
 @click.option("-m", "--manual_fix_file")
-def download_publication(pc_file, pc_name, out_file, need_fix_file, manual_fix_file):
+@fetch_options
+@click.option(
+    "-c",
+    "--checkpoint_file",
+    help="Append each downloaded member here, default: <out_file>.checkpoint.jsonl",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Download again members who already have publications",
+)
+def download_publication(
+    pc_file,
+    pc_name,
+    out_file,
+    need_fix_file,
+    manual_fix_file,
+    jobs,
+    rate,
+    burst,
+    retries,
+    base_url,
+    cache_dir,
+    no_cache,
+    offline,
+    checkpoint_file,
+    refresh,
+):
     logger = logging.getLogger()
     with open(pc_file, "r") as f:
         pc = json.load(f)
@@ -87,40 +165,93 @@ def download_publication(pc_file, pc_name, out_file, need_fix_file, manual_fix_f
         with open(manual_fix_file, "r") as f:
             pc_fixed = json.load(f)
 
+    if not checkpoint_file:
+        checkpoint_file = f"{out_file}.checkpoint.jsonl"
+    if refresh:
+        # Start over, a refresh mostly costs 304s with the cache
+        Path(checkpoint_file).unlink(missing_ok=True)
+        for p in pc:
+            if not pc_name or p["name"] == pc_name:
+                p.pop("publication", None)
+    checkpoint = load_checkpoint(checkpoint_file)
+
     modified = False
     pc_no_dblp = []
     pc_empty_publication = []
+    pc_failed = []
+    to_download = []
+    completed = False
     try:
         for i, p in enumerate(pc):
             if pc_name and p["name"] != pc_name:
                 continue
-            logger.info(f'Parsing publication for PC [{i:>3}]: [{p["name"]:30}]')
             if "publication" not in p.keys() and pc_fixed:
                 for pf in pc_fixed:
                     if pf["name"] == p["name"]:
                         p["publication"] = pf["publication"]
                         logger.info(
-                            f'    Got [{len(p["publication"]):>3}] publications from manual fixed file'
+                            f'PC [{i:>3}]: [{p["name"]:30}] Got [{len(p["publication"]):>3}] publications from manual fixed file'
                         )
                         modified = True
 
+            if "publication" not in p.keys() and p["name"] in checkpoint:
+                p["publication"] = checkpoint[p["name"]]
+                modified = True
+
             if "publication" in p.keys():
-                logger.info(
-                    f'    Already have [{len(p["publication"]):>3}] publications, skip'
+                logger.debug(
+                    f'PC [{i:>3}]: [{p["name"]:30}] Already have [{len(p["publication"]):>3}] publications, skip'
                 )
                 continue
 
             if "pid" not in p["dblp"]:
-                logger.info(f"    Does not have dblp link, skip")
+                logger.info(
+                    f'PC [{i:>3}]: [{p["name"]:30}] Does not have dblp link, skip'
+                )
                 pc_no_dblp.append(p)
                 continue
 
-            p["publication"] = download_single_pc_publication(p)
-            if "publication" not in p.keys() or len(p["publication"]) == 0:
-                pc_empty_publication.append(p)
-            logger.info(f'    Got [{len(p["publication"]):>3}] publications')
-            modified = True
-            time.sleep(1)
+            to_download.append(p)
+
+        logger.info(
+            f"Downloading publications for [{len(to_download)}] PC members, "
+            f"[{len(checkpoint)}] resumed from {checkpoint_file}"
+        )
+        start = time.perf_counter()
+        with make_fetcher(
+            jobs, rate, burst, retries, cache_dir, no_cache, offline
+        ) as fetch, open(checkpoint_file, "a") as ckpt:
+            download = functools.partial(
+                download_single_pc_publication, fetch=fetch, base_url=base_url
+            )
+            # Closing the results cancels the queued downloads on failure
+            with contextlib.closing(fetch.map(download, to_download)) as results:
+                for n, (p, publication, error) in enumerate(results, 1):
+                    if error:
+                        logger.error(
+                            f'[{n:>3}/{len(to_download)}] [{p["name"]:30}] {error}'
+                        )
+                        pc_failed.append(p)
+                        continue
+                    p["publication"] = publication
+                    ckpt.write(
+                        json.dumps({"name": p["name"], "publication": publication})
+                        + "\n"
+                    )
+                    ckpt.flush()
+                    modified = True
+                    if len(p["publication"]) == 0:
+                        pc_empty_publication.append(p)
+                    logger.info(
+                        f'[{n:>3}/{len(to_download)}] [{p["name"]:30}] Got [{len(p["publication"]):>3}] publications'
+                    )
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Downloaded [{len(to_download) - len(pc_failed)}] PC members with "
+            f"[{fetch.request_count}] requests in {elapsed:.1f}s"
+        )
+        if fetch.cache:
+            logger.info(f"HTTP cache: {fetch.cache.summary()}")
 
         if len(pc_no_dblp) > 0:
             logger.info(
@@ -136,10 +267,246 @@ def download_publication(pc_file, pc_name, out_file, need_fix_file, manual_fix_f
                 f"please manually fill at least one publication record for each of them:\n"
                 + summarize_pc_member(pc_empty_publication).get_string()
             )
+        if len(pc_failed) > 0:
+            logger.info(
+                f"Failed to download publications for the following pc members, "
+                f"run this command again to retry:\n"
+                + summarize_pc_member(pc_failed).get_string()
+            )
+        completed = True
     finally:
         if out_file and modified:
-            with open(out_file, "w") as f:
+            tmp_file = f"{out_file}.tmp"
+            with open(tmp_file, "w") as f:
                 json.dump(pc, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_file, out_file)
+        if completed:
+            # Everything is in out_file now
+            Path(checkpoint_file).unlink(missing_ok=True)
+
+
+@dblp.command()
+@click.option("-a", "--author_dbcol_name", default="hotcrp:pc")
+@click.option("-p", "--paper_dbcol_name", default="dblp:paper")
+@click.option("-n", "--pc_name")
+@fetch_options
+@click.option(
+    "-b",
+    "--batch_size",
+    type=int,
+    default=1000,
+    help="Number of operations per bulk_write batch",
+)
+@click.option("-f", "--force", is_flag=True, help="Diff even if the .bib is unchanged")
+def sync_publication(
+    author_dbcol_name,
+    paper_dbcol_name,
+    pc_name,
+    jobs,
+    rate,
+    burst,
+    retries,
+    base_url,
+    cache_dir,
+    no_cache,
+    offline,
+    batch_size,
+    force,
+):
+    """Fetch PC publications again and only write what changed in MongoDB.
+
+    Members are those imported by `import.py dblp`. A member whose .bib is
+    the same as at the last sync (dblp_sync watermark) is skipped. Otherwise
+    the bibtex keys are diffed against the member's dblp_publication: new
+    papers are inserted, papers already in dblp:paper only get the member
+    added to PCAuthor, and papers gone from DBLP get the member removed.
+    """
+    logger = logging.getLogger()
+    adb = make_mongodb(author_dbcol_name)
+    pdb = make_mongodb(paper_dbcol_name)
+
+    query = {"dblp": {"$regex": "pid"}}
+    if pc_name:
+        query["name"] = pc_name
+    projection = {
+        "name": 1,
+        "email": 1,
+        "dblp": 1,
+        "dblp_publication": 1,
+        "dblp_sync": 1,
+    }
+    members = list(adb.client.find(query, projection))
+    logger.info(f"Syncing publications for [{len(members)}] PC members")
+
+    stats = {
+        "unchanged": 0,
+        "changed": 0,
+        "failed": 0,
+        "inserted": 0,
+        "linked": 0,
+        "unlinked": 0,
+    }
+    start = time.perf_counter()
+    with make_fetcher(
+        jobs, rate, burst, retries, cache_dir, no_cache, offline
+    ) as fetch, bulk_writer(pdb, batch_size) as pbw, bulk_writer(
+        adb, batch_size, depends_on=[pbw]
+    ) as abw:
+        # The paper writes are sent before the watermarks, a member is never
+        # recorded as synced while its papers are still queued
+        download = functools.partial(
+            fetch_changed_publication, fetch=fetch, base_url=base_url, force=force
+        )
+        with contextlib.closing(fetch.map(download, members)) as results:
+            for n, (m, res, error) in enumerate(results, 1):
+                if error:
+                    logger.error(f'[{n:>3}/{len(members)}] [{m["name"]:30}] {error}')
+                    stats["failed"] += 1
+                    continue
+                digest, entries = res
+                if entries is None:
+                    logger.debug(f'[{n:>3}/{len(members)}] [{m["name"]:30}] Unchanged')
+                    stats["unchanged"] += 1
+                    continue
+                stats["changed"] += 1
+                delta = sync_member_publication(m, entries, digest, pdb, pbw, abw)
+                for k, v in delta.items():
+                    stats[k] += v
+                logger.info(
+                    f'[{n:>3}/{len(members)}] [{m["name"]:30}] '
+                    f'[{delta["inserted"]:>3}] new papers, [{delta["linked"]:>3}] linked, '
+                    f'[{delta["unlinked"]:>3}] removed'
+                )
+    logger.info(
+        f"Synced [{len(members)}] PC members in "
+        f"{time.perf_counter() - start:.1f}s: {stats}"
+    )
+    if fetch.cache:
+        logger.info(f"HTTP cache: {fetch.cache.summary()}")
+
+
+def fetch_changed_publication(pc_record, fetch, base_url=None, force=False):
+    """Return (digest, bib entries) of a member, entries is None if the .bib
+    did not change since the last sync."""
+    url = rewrite_base_url(f'{pc_record["dblp"]}.bib', base_url)
+    content = fetch.get_content(url)
+    digest = hashlib.sha256(content).hexdigest()
+    if not force and pc_record.get("dblp_sync", {}).get("digest") == digest:
+        return digest, None
+    return digest, parse_bib(content)
+
+
+def sync_member_publication(pc_record, entries, digest, pdb, pbw, abw):
+    """Queue the writes for the difference between the fetched entries and
+    the member's dblp_publication, and move the member's watermark."""
+    fetched = {e["ID"]: e for e in entries if "ID" in e}
+    linked = set(pc_record.get("dblp_publication", []))
+    new = [k for k in fetched if k not in linked]
+    removed = [k for k in linked if k not in fetched]
+    existing = set()
+    if new:
+        existing = set(pdb.client.find({"_id": {"$in": new}}).distinct("_id"))
+
+    pa = {"name": pc_record["name"], "email": pc_record["email"]}
+    for k in new:
+        if k in existing:
+            pbw.update_one({"_id": k}, {"$addToSet": {"PCAuthor": pa}})
+        else:
+            p = dblp_paper_record(fetched[k])
+            pbw.update_one(
+                {"_id": k}, {"$set": p, "$addToSet": {"PCAuthor": pa}}, upsert=True
+            )
+    for k in removed:
+        pbw.update_one({"_id": k}, {"$pull": {"PCAuthor": {"email": pa["email"]}}})
+    abw.update_one(
+        {"_id": pc_record["_id"]},
+        {
+            "$set": {
+                "dblp_publication": list(fetched),
+                "dblp_sync": {
+                    "digest": digest,
+                    "time": datetime.datetime.now(datetime.timezone.utc),
+                    "count": len(fetched),
+                },
+            }
+        },
+    )
+    return {
+        "inserted": len(new) - len(existing),
+        "linked": len(existing),
+        "unlinked": len(removed),
+    }
+
+
+def load_checkpoint(checkpoint_file):
+    """Return {pc name: publications} downloaded by a previous, interrupted run."""
+    checkpoint = dict()
+    if not os.path.exists(checkpoint_file):
+        return checkpoint
+    with open(checkpoint_file, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run killed while writing
+                continue
+            checkpoint[record["name"]] = record["publication"]
+    return checkpoint
+
+
+@dblp.command()
+@click.argument("bib_path", nargs=-1)
+@click.option("--cache_dir", default=DEFAULT_CACHE_DIR, show_default=True)
+@click.option("-r", "--repeat", type=int, default=3)
+def benchmark_bib(bib_path, cache_dir, repeat):
+    """
+    Compare the DBLP bib parser in bib.py with bibtexparser on real DBLP
+    bibliographies: .bib files or directories of them, by default the .bib
+    files in the HTTP cache of download_publication.
+    """
+    logger = logging.getLogger()
+    files = []
+    for path in bib_path or [cache_dir]:
+        path = Path(path)
+        if path.is_dir():
+            files += sorted(path.rglob("*.bib")) + sorted(path.rglob("*.body"))
+        else:
+            files.append(path)
+    corpus = [(f, f.read_bytes()) for f in files]
+    total_bytes = sum(len(c) for _, c in corpus)
+    logger.info(f"Corpus: [{len(corpus)}] files, [{total_bytes}] bytes")
+
+    timing = dict()
+    for name, parser in [
+        ("bibtexparser", lambda c: bibtexparser.loads(c).entries),
+        ("bib.py", parse_bib),
+    ]:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _, content in corpus:
+                parser(content)
+            best = min(best, time.perf_counter() - start)
+        timing[name] = best
+
+    entries = diff = 0
+    keep = set(DEFAULT_FIELDS) | {"ENTRYTYPE", "ID"}
+    for f, content in corpus:
+        expected = [
+            {k: v for k, v in e.items() if k in keep}
+            for e in bibtexparser.loads(content).entries
+        ]
+        parsed = parse_bib(content)
+        entries += len(expected)
+        if expected != parsed:
+            diff += 1
+            logger.info(f"Different entries in {f}")
+    for name, t in timing.items():
+        logger.info(
+            f"{name:>12}: {t:.3f}s, {total_bytes / t / 1e6:.2f} MB/s (best of {repeat})"
+        )
+    logger.info(f"     speedup: {timing['bibtexparser'] / timing['bib.py']:.1f}x")
+    logger.info(f"[{entries}] entries, files with different entries: [{diff}]")
 
 
 def parse_dblp_url(origin_url):
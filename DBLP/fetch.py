@@ -0,0 +1,167 @@
+import logging
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class token_bucket:
+    """Thread-safe token bucket: rate requests per second, bursts of burst."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.acquired = 0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.acquired += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class fetcher:
+    """Rate-limited HTTP client shared by a pool of download workers.
+
+    All workers share one keep-alive session and one token bucket, so the
+    crawl runs at the rate limit no matter the latency. Responses with status
+    429 or 5xx, and connection errors, are retried with exponential backoff
+    (or the server's Retry-After), up to retries times.
+    """
+
+    def __init__(
+        self,
+        rate=1.0,
+        burst=1,
+        workers=4,
+        retries=5,
+        backoff=1.0,
+        timeout=30,
+        cache=None,
+    ):
+        self.logger = logging.getLogger("fetch")
+        self.cache = cache
+        self.bucket = token_bucket(rate, burst)
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def retry_delay(self, attempt, response=None):
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        return self.backoff * 2**attempt * (1 + random.random() / 2)
+
+    def get(self, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.retry_delay(attempt)
+                self.logger.warning(f"    {e}, retry in {delay:.1f}s: {url}")
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response
+                if attempt == self.retries:
+                    response.raise_for_status()
+                delay = self.retry_delay(attempt, response)
+                self.logger.warning(
+                    f"    HTTP {response.status_code}, retry in {delay:.1f}s: {url}"
+                )
+            time.sleep(delay)
+
+    def get_content(self, url):
+        """Return the response body of url, through the cache if any.
+
+        A cached URL is revalidated with a conditional request, and the cached
+        body is returned on 304. In offline mode the cache is the only source.
+        """
+        if not self.cache:
+            return self.get(url).content
+        cached = self.cache.get(url)
+        if self.cache.offline:
+            if cached is None:
+                raise Exception(f"Not in cache (offline mode): {url}")
+            self.cache.count("hit")
+            return cached[1]
+        headers = self.cache.validators(cached[0]) if cached else {}
+        response = self.get(url, headers=headers)
+        if response.status_code == 304 and cached:
+            self.cache.count("not_modified")
+            return cached[1]
+        self.cache.count("miss")
+        self.cache.put(url, response)
+        return response.content
+
+    def map(self, func, items):
+        return map_concurrent(func, items, self.workers)
+
+    @property
+    def request_count(self):
+        return self.bucket.acquired
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def map_concurrent(func, items, workers):
+    """Run func(item) on a pool of workers, yield (item, result, error) as
+    they complete.
+
+    If the caller stops early (Ctrl-C, or the generator is closed) the items
+    not started yet are cancelled instead of waited for.
+    """
+    pool = ThreadPoolExecutor(max_workers=workers)
+    completed = False
+    try:
+        futures = {pool.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+        completed = True
+    finally:
+        pool.shutdown(wait=True, cancel_futures=not completed)
+
+
+def rewrite_base_url(url, base_url=None):
+    """Replace the scheme and host of url, e.g. to run against a local server."""
+    if not base_url:
+        return url
+    return re.sub(r"^https?://[^/]+", base_url.rstrip("/"), url)
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+
+
+class http_cache:
+    """On-disk cache of HTTP response bodies, keyed by the SHA-256 of the URL.
+
+    Each entry is a body file and a JSON file with the URL and the ETag and
+    Last-Modified validators, sent back as If-None-Match/If-Modified-Since so
+    an unchanged page costs a 304 without body. In offline mode, responses
+    are only served from the cache.
+    """
+
+    def __init__(self, cache_dir, offline=False):
+        self.logger = logging.getLogger("http_cache")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.stats = {"hit": 0, "not_modified": 0, "miss": 0}
+
+    def path(self, url):
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / digest[:2] / digest
+
+    def get(self, url):
+        """Return (metadata, body) of a cached URL, or None."""
+        entry = self.path(url)
+        meta_file = entry.with_suffix(".json")
+        body_file = entry.with_suffix(".body")
+        if not meta_file.exists() or not body_file.exists():
+            return None
+        try:
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+        except json.JSONDecodeError:
+            self.logger.warning(f"Ignoring corrupted cache entry {meta_file}")
+            return None
+        if meta.get("url") != url:
+            return None
+        return meta, body_file.read_bytes()
+
+    def put(self, url, response):
+        entry = self.path(url)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        body_file = entry.with_suffix(".body")
+        tmp_file = entry.with_suffix(".body.tmp")
+        tmp_file.write_bytes(response.content)
+        tmp_file.replace(body_file)
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        meta_file = entry.with_suffix(".json")
+        tmp_file = entry.with_suffix(".json.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(meta, f)
+        tmp_file.replace(meta_file)
+
+    def validators(self, meta):
+        """Conditional request headers for a cached entry."""
+        headers = dict()
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def summary(self):
+        return (
+            f"[{self.stats['not_modified']}] not modified, "
+            f"[{self.stats['miss']}] downloaded, "
+            f"[{self.stats['hit']}] served offline"
+        )
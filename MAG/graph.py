@@ -0,0 +1,290 @@
+import contextlib
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import quote
+
+from DBLP.fetch import fetcher, map_concurrent
+from Utils.names import best_match, canonical_name
+
+DEFAULT_CACHE_DIR = str(Path.home() / ".cache" / "mightypc" / "graph")
+
+PAPER_ATTRS = [
+    "Ti",
+    "Y",
+    "D",
+    "DN",
+    "F.FN",
+    "F.DFN",
+    "F.FId",
+    "CC",
+    "AA.AuN",
+    "AA.DAuN",
+    "AA.AuId",
+    "Id",
+    "AA.AfId",
+    "AA.AfN",
+    "AA.DAfN",
+]
+
+
+def norm_mag_title(title):
+    """Title in the form of the MAG Ti attribute: lowercase words."""
+    t = title.lower()
+    t = re.sub(r"\W", " ", t)
+    t = re.sub(r" +", " ", t)
+    return t.strip()
+
+
+class query_cache:
+    """On-disk cache of backend responses, keyed by the SHA-256 of the backend
+    name and the query. Each entry is one JSON file."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir).resolve()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.json"
+
+    def get(self, key):
+        entry_file = self.path(key)
+        try:
+            with open(entry_file, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return entry["response"]
+
+    def put(self, key, response):
+        entry_file = self.path(key)
+        entry_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = entry_file.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({"query": key, "response": response}, f, ensure_ascii=False)
+        tmp_file.replace(entry_file)
+
+
+class mag_backend:
+    """Microsoft Academic Graph evaluate API, rate-limited and concurrent
+    through DBLP/fetch.py. Title lookups are batched into Or() expressions."""
+
+    name = "mag"
+    batch_size = 10
+    cacheable = True
+
+    def __init__(self, rate=1.0, jobs=4):
+        # Set MIGHTYPC_MAG_KEY to your Microsoft Academic Graph API subscription key
+        self.sub_key = os.environ.get(
+            "MIGHTYPC_MAG_KEY", "XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
+        )
+        self.url = "https://api.labs.cognitive.microsoft.com/academic/v1.0/evaluate"
+        self.fetch = fetcher(rate=rate, workers=jobs)
+
+    def evaluate(self, expr, count):
+        args = f"expr={quote(expr)}&complete=1&count={count}"
+        args += f"&attributes={','.join(PAPER_ATTRS)}"
+        # The key goes in a header, URLs end up in the logs
+        headers = {"Ocp-Apim-Subscription-Key": self.sub_key}
+        return self.fetch.get(f"{self.url}?{args}", headers=headers).json()
+
+    def papers_by_titles(self, titles):
+        """Return {normalized title: [entities]} for one batch of titles."""
+        expr = ",".join(f"Ti='{t}'" for t in titles)
+        if len(titles) > 1:
+            expr = f"Or({expr})"
+        res = {t: [] for t in titles}
+        for e in self.evaluate(expr, count=10 * len(titles))["entities"]:
+            if e.get("Ti") in res:
+                res[e["Ti"]].append(e)
+        return res
+
+    def author_papers(self, author_id, count):
+        return self.evaluate(f"Composite(AA.AuId={author_id})", count)["entities"]
+
+
+class snapshot_backend:
+    """Answers queries from a local JSON lines snapshot, with no network.
+
+    Each line is an OpenAlex work (with "authorships") or a DBLP paper as
+    stored in dblp:paper (with an "author" list); both are converted to MAG
+    entities. DBLP authors have no ids, their canonical name is used instead.
+    """
+
+    name = "snapshot"
+    batch_size = 1000
+    # Lookups are in memory already
+    cacheable = False
+
+    def __init__(self, snapshot_file):
+        self.logger = logging.getLogger("graph")
+        self.by_title = defaultdict(list)
+        self.by_author = defaultdict(list)
+        opener = gzip.open if str(snapshot_file).endswith(".gz") else open
+        with opener(snapshot_file, "rt") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                e = self.entity(json.loads(line))
+                self.by_title[e["Ti"]].append(e)
+                for a in e["AA"]:
+                    self.by_author[str(a["AuId"])].append(e)
+        self.logger.info(
+            f"Loaded [{len(self.by_title)}] titles and [{len(self.by_author)}] "
+            f"authors from {snapshot_file}"
+        )
+
+    @staticmethod
+    def entity(record):
+        if "authorships" in record:
+            title = record.get("display_name") or record.get("title") or ""
+            authors = [
+                {
+                    "AuId": a["author"]["id"].rsplit("/", 1)[-1],
+                    "DAuN": a["author"]["display_name"],
+                    "AuN": canonical_name(a["author"]["display_name"]),
+                }
+                for a in record["authorships"]
+            ]
+            return {
+                "Id": record["id"].rsplit("/", 1)[-1],
+                "Ti": norm_mag_title(title),
+                "DN": title,
+                "Y": record.get("publication_year"),
+                "CC": record.get("cited_by_count", 0),
+                "AA": authors,
+            }
+        title = record.get("title", "")
+        return {
+            "Id": record.get("_id") or record.get("ID"),
+            "Ti": norm_mag_title(title),
+            "DN": title,
+            "Y": int(record["year"]) if record.get("year") else None,
+            "CC": 0,
+            "AA": [
+                {"AuId": canonical_name(a), "DAuN": a, "AuN": canonical_name(a)}
+                for a in record.get("author", [])
+            ],
+        }
+
+    def papers_by_titles(self, titles):
+        return {t: self.by_title.get(t, []) for t in titles}
+
+    def author_papers(self, author_id, count):
+        return self.by_author.get(str(author_id), [])[:count]
+
+
+class graph_client:
+    """Backend-agnostic academic graph client.
+
+    Responses are cached on disk by query, title lookups are sent in batches
+    of backend.batch_size, and queries run concurrently on jobs workers, the
+    HTTP backend being rate limited by its own fetcher.
+    """
+
+    def __init__(self, backend, cache_dir=DEFAULT_CACHE_DIR, jobs=4):
+        self.logger = logging.getLogger("graph")
+        self.backend = backend
+        self.jobs = jobs
+        self.cache = None
+        if cache_dir and backend.cacheable:
+            self.cache = query_cache(cache_dir)
+
+    def cached(self, query, func, refresh=False):
+        """Return func(), cached under query. Empty responses are not cached,
+        they may be filled later. With refresh, the cache is only written."""
+        key = f"{self.backend.name}|{query}"
+        if self.cache and not refresh:
+            res = self.cache.get(key)
+            if res is not None:
+                return res
+        res = func()
+        if self.cache and res:
+            self.cache.put(key, res)
+        return res
+
+    def papers_by_titles(self, titles):
+        """Return {title: [MAG entities]} for many titles."""
+        norm = {t: norm_mag_title(t) for t in titles}
+        res = dict()
+        todo = []
+        for t in sorted(set(norm.values())):
+            if self.cache:
+                cached = self.cache.get(f"{self.backend.name}|Ti={t}")
+                if cached is not None:
+                    res[t] = cached
+                    continue
+            todo.append(t)
+        size = self.backend.batch_size
+        batches = [todo[i : i + size] for i in range(0, len(todo), size)]
+        lookups = map_concurrent(self.backend.papers_by_titles, batches, self.jobs)
+        with contextlib.closing(lookups):
+            for batch, found, error in lookups:
+                # A failed lookup is not "no match", the titles of the batches
+                # done so far are in the cache for the next run
+                if error:
+                    raise Exception(
+                        f"Title lookup failed for {len(batch)} titles: {error}"
+                    ) from error
+                for t, entities in found.items():
+                    res[t] = entities
+                    if self.cache and entities:
+                        self.cache.put(f"{self.backend.name}|Ti={t}", entities)
+        return {t: res.get(n, []) for t, n in norm.items()}
+
+    def author_id(self, author_name, entity):
+        """Return (author id, display name) of the author of entity whose name
+        is the most similar to author_name."""
+        authors = entity.get("AA", [])
+        match = best_match(author_name, [a["DAuN"] for a in authors])
+        if match is None:
+            return None, None
+        auid = next(a["AuId"] for a in authors if a["DAuN"] == match[0])
+        return auid, match[0]
+
+    def author_papers(self, author_ids, count=10, refresh=False):
+        """Yield (author id, [MAG entities]) for many authors, concurrently.
+        With refresh, the papers are queried again instead of read from the
+        cache."""
+
+        def query(auid):
+            return self.cached(
+                f"AA.AuId={auid}&count={count}",
+                lambda: self.backend.author_papers(auid, count),
+                refresh=refresh,
+            )
+
+        with contextlib.closing(map_concurrent(query, author_ids, self.jobs)) as res:
+            for auid, papers, error in res:
+                if error:
+                    raise error
+                yield auid, papers
+
+    def summary(self):
+        if not self.cache:
+            return "no cache"
+        return f"[{self.cache.hits}] cache hits, [{self.cache.misses}] misses"
+
+    def close(self):
+        if isinstance(self.backend, mag_backend):
+            self.backend.fetch.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,16 +1,23 @@
 import contextlib
 import csv
+import inspect
 import json
 import logging
 import os
 import pprint
-import re
-import time
+import sys
 from pathlib import Path
 
 import click
-import requests
-from fuzzywuzzy import fuzz
+
+# To import a module from parent dir
+# https://stackoverflow.com/questions/714063/importing-modules-from-parent-folder
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+from graph import DEFAULT_CACHE_DIR, graph_client, mag_backend, snapshot_backend
+from Utils.utils import option_group
 
 log_format = logging.Formatter(
     "[%(asctime)s][%(filename)s:%(lineno)4s - %(funcName)10s()] %(message)s"
@@ -24,65 +31,22 @@ logging.getLogger().addHandler(handler)
 logging.getLogger().setLevel(logging.DEBUG)
 
 
-class mag_client:
-    def __init__(self):
-        # Replace with your own Microsoft Academic Graph API subscription key
-        self.sub_key = "XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
-        self.paper_attrs = [
-            "Ti",
-            "Y",
-            "D",
-            "DN",
-            "F.FN",
-            "F.DFN",
-            "F.FId",
-            "CC",
-            "AA.AuN",
-            "AA.DAuN",
-            "AA.AuId",
-            "Id",
-            "AA.AfId",
-            "AA.AfN",
-            "AA.DAfN",
-        ]
-        self.logger = logging.getLogger("mag_client")
-        pass
-
-    def evaluate(self, args):
-        url = f"https://api.labs.cognitive.microsoft.com/academic/v1.0/evaluate?subscription-key={self.sub_key}&{args}"
-        response = requests.get(url=url).json()
-        time.sleep(1)
-        return response
-
-    def get_author_id(self, author_name, pub_title):
-        # Normalize title
-        pub_title = pub_title.lower()
-        pub_title = re.sub(r"\W", " ", pub_title)
-        pub_title = re.sub(r" +", " ", pub_title)
-        # Get record
-        record = self.evaluate(
-            f"expr=Ti='{pub_title}'&complete=1&count=10&attributes={','.join(self.paper_attrs)}"
-        )
-        if len(record["entities"]) == 0:
-            self.logger.debug(f"Got empty pub info for {pub_title}:\n{record}")
-            return False, None, None
-        # Get author id
-        auid = None
-        daun = None
-        ratio = -float("inf")
-        for author in record["entities"][0]["AA"]:
-            curr_ratio = fuzz.ratio(author_name.lower(), author["DAuN"].lower())
-            if curr_ratio > ratio:
-                ratio = curr_ratio
-                auid = author["AuId"]
-                daun = author["DAuN"]
-        return True, auid, daun
-
-    def get_author_pubs(self, author_id, count=10):
-        pubs = self.evaluate(
-            f"expr=Composite(AA.AuId={author_id})&complete=1&count={count}&attributes={','.join(self.paper_attrs)}"
-        )
-        return pubs
+# Options shared by the commands querying the academic graph
+graph_options = option_group(
+    click.option("-s", "--snapshot", default=None, help="Answer queries from a local OpenAlex/DBLP JSON lines snapshot instead of the MAG API"),
+    click.option("-j", "--jobs", type=int, default=4, help="Concurrent queries"),
+    click.option("-r", "--rate", type=float, default=1.0, help="MAG API requests per second"),
+    click.option("--cache_dir", default=DEFAULT_CACHE_DIR, help="Cache of MAG API responses"),
+    click.option("--no_cache", is_flag=True),
+)
+
+
+def make_graph_client(snapshot, jobs, rate, cache_dir, no_cache):
+    if snapshot:
+        backend = snapshot_backend(snapshot)
+    else:
+        backend = mag_backend(rate=rate, jobs=jobs)
+    return graph_client(backend, cache_dir=None if no_cache else cache_dir, jobs=jobs)
 
 
 @click.group()
@@ -96,9 +60,9 @@ def mag():
 @click.option("-n", "--number_of_authors", type=int, default=1)
 @click.option("-a", "--all_authors", is_flag=True, help="Set this flag to get all authors' info, or use '-n' to specify how many authors to crawl and parse")
 @click.option("-m", "--max_try", type=int, default=3)
-def parse_author(in_file, out_file, number_of_authors, all_authors, max_try):
+@graph_options
+def parse_author(in_file, out_file, number_of_authors, all_authors, max_try, **graph_args):
     logger = logging.getLogger()
-    client = mag_client()
     with open(in_file, "r") as f:
         authors = json.load(f)
         if not all_authors:
@@ -108,42 +72,56 @@ def parse_author(in_file, out_file, number_of_authors, all_authors, max_try):
             res = json.load(f)
     else:
         res = {}
-    try:
-        for author in authors:
-            author_name = author["name"]
-            if author_name in res and "mag_id" in res[author_name]:
-                logger.info(f"Member [{author_name:30}] already has MAG info, skip")
-                continue
-
-            auid = daun = None
-            for i, pub in enumerate(reversed(author["publication"])):
-                pub_title = pub["title"]
-                succ, auid, daun = client.get_author_id(author_name, pub_title)
-                if succ:
-                    break
+
+    todo = []
+    for author in authors:
+        author_name = author["name"]
+        if author_name in res and "mag_id" in res[author_name]:
+            logger.info(f"Member [{author_name:30}] already has MAG info, skip")
+            continue
+        todo.append(author)
+
+    # Look up the candidate titles of all members at once, in batches
+    titles = {
+        author["name"]: [
+            pub["title"] for pub in reversed(author["publication"])
+        ][: max_try + 1]
+        for author in todo
+    }
+    with make_graph_client(**graph_args) as client:
+        found = client.papers_by_titles({t for ts in titles.values() for t in ts})
+        logger.info(f"Looked up [{len(found):5}] titles, {client.summary()}")
+
+        try:
+            for author in todo:
+                author_name = author["name"]
+                for i, pub_title in enumerate(titles[author_name]):
+                    if found[pub_title]:
+                        auid, daun = client.author_id(author_name, found[pub_title][0])
+                        break
+                    logger.debug(f"Got empty pub info for {pub_title}")
                 else:
-                    if i >= max_try:
-                        err_msg = f"Failed to detect MAG info for member [{author_name:30}] after [{i:3}] tries"
-                        logger.error(err_msg)
-                        raise Exception(err_msg)
-
-            res_author = {
-                "mag_id": auid,
-                "mag_name": daun,
-                "name": author["name"],
-                "email": author["email"],
-                "dblp": author["dblp"],
-                "dblp_origin": author["dblp_origin"],
-                "google_scholar": author["google_scholar"],
-            }
-
-            res[author_name] = res_author
-            logger.info(
-                f"Author [{author_name:30}] | MAG Id [{auid:10}] | MAG Name [{daun:30}]"
-            )
-    finally:
-        with open(out_file, "w") as f:
-            json.dump(res, f, ensure_ascii=False, indent=4)
+                    err_msg = f"Failed to detect MAG info for member [{author_name:30}] after [{len(titles[author_name]):3}] tries"
+                    logger.error(err_msg)
+                    raise Exception(err_msg)
+
+                res_author = {
+                    "mag_id": auid,
+                    "mag_name": daun,
+                    "name": author["name"],
+                    "email": author["email"],
+                    "dblp": author["dblp"],
+                    "dblp_origin": author["dblp_origin"],
+                    "google_scholar": author["google_scholar"],
+                }
+
+                res[author_name] = res_author
+                logger.info(
+                    f"Author [{author_name:30}] | MAG Id [{str(auid):10}] | MAG Name [{str(daun):30}]"
+                )
+        finally:
+            with open(out_file, "w") as f:
+                json.dump(res, f, ensure_ascii=False, indent=4)
 
 
 @mag.command()
@@ -174,16 +152,17 @@ def check_missing_member(mag_file, pc_file):
 @click.option("-p", "--number_of_papers", type=int, default=10, help='How many papers to download, set to a small number for debugging, and a large number (e.g. 1000) to get all publications for each member.')
 @click.option("-n", "--number_of_authors", type=int, default=1)
 @click.option("-a", "--all_authors", is_flag=True)
+@graph_options
 def download_papers(
-    author_json_file, output_dir, force, number_of_papers, number_of_authors, all_authors
+    author_json_file, output_dir, force, number_of_papers, number_of_authors, all_authors, **graph_args
 ):
     logger = logging.getLogger()
-    client = mag_client()
     with open(author_json_file, "r") as f:
         authors = json.load(f)
         authors = [a for _, a in authors.items()]
         if not all_authors:
             authors = authors[:number_of_authors]
+    todo = dict()
     for author in authors:
         out_file = Path(output_dir) / f'{author["name"]}.json'
         if out_file.exists() and not force:
@@ -191,25 +170,31 @@ def download_papers(
                 f'Found publication records for author [{author["name"]:30}], skipping'
             )
             continue
-
-        auid = author["mag_id"]
-        pubs = client.get_author_pubs(auid, count=number_of_papers)
-        len_pubs = len(pubs["entities"])
-        logger.info(f'Got [{len_pubs:4}] publications for [{author["name"]:30}]')
-        if len_pubs == 0:
-            raise Exception(
-                f"Found no publication for author {author}, MAG response {pubs}"
-            )
-        if len_pubs == number_of_papers:
-            logger.warning(
-                f"    Required [{number_of_papers:4}] publications, "
-                f"got [{len_pubs:4}], "
-                f"potentially more publications to get"
-            )
-
-        with chmkdir(output_dir):
-            with open(f'{author["name"]}.json', "w") as f:
-                json.dump(pubs["entities"], f, ensure_ascii=False, indent=4)
+        todo[author["mag_id"]] = author
+
+    with make_graph_client(**graph_args) as client:
+        # --force queries the papers again instead of reading the cache
+        for auid, pubs in client.author_papers(
+            list(todo), count=number_of_papers, refresh=force
+        ):
+            author = todo[auid]
+            len_pubs = len(pubs)
+            logger.info(f'Got [{len_pubs:4}] publications for [{author["name"]:30}]')
+            if len_pubs == 0:
+                raise Exception(
+                    f"Found no publication for author {author}, MAG response {pubs}"
+                )
+            if len_pubs == number_of_papers:
+                logger.warning(
+                    f"    Required [{number_of_papers:4}] publications, "
+                    f"got [{len_pubs:4}], "
+                    f"potentially more publications to get"
+                )
+
+            with chmkdir(output_dir):
+                with open(f'{author["name"]}.json', "w") as f:
+                    json.dump(pubs, f, ensure_ascii=False, indent=4)
+        logger.info(f"Downloaded [{len(todo):4}] authors, {client.summary()}")
 
 
 @contextlib.contextmanager
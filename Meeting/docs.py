@@ -17,6 +17,7 @@ currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentfram
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 
+from MongoDB.pc_directory import pc_directory
 from MongoDB.utils import make_mongodb
 from Utils.logger import setup_logger
 from Utils.utils import chmkdir, chdir
@@ -58,9 +59,7 @@ def gen_member_check_docs(
     """
     sdb = make_mongodb(submission_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
-    all_pc = pdb.client.find(
-        {"roles": {"$regex": r".*pc.*"}}, {"name": 1, "email": 1, "tags": 1}
-    )
+    all_pc = [pc for pc in pc_directory(pdb) if "pc" in pc.get("roles", "")]
 
     if submission_id:
         gen_member_check_docs_single(submission_id, sdb, pdb, all_pc, output_path)
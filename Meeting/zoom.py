@@ -15,6 +15,7 @@ currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentfram
 parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 
+from MongoDB.pc_directory import pc_directory
 from MongoDB.utils import make_mongodb
 from Utils.logger import setup_logger
 
@@ -172,22 +173,8 @@ def read_zoom_email(zoom_email_survey_file, ignore_member_email) -> dict:
 
 
 def find_all_tpc(pdb):
-    tpc = []
-    # Find all pc member with 'tpc' tag
-    tpc += pdb.client.find({"tags": "tpc"}, {"name": 1, "email": 1, "zoom_email": 1})
-    # Chair may not have 'tpc' tag, search instead for 'chair' role
-    tpc += pdb.client.find(
-        {"roles": {"$regex": r".*chair.*"}}, {"name": 1, "email": 1, "zoom_email": 1}
-    )
-    # Remove redundent results, e.g. Chair has 'tpc' tag and 'chair' role
-    tpc_unique = []
-    tpc_emails = set()
-    for t in tpc:
-        if t["email"] not in tpc_emails:
-            tpc_emails.add(t["email"])
-            tpc_unique.append(t)
-
-    return tpc_unique
+    # All pc member with 'tpc' tag, and chairs who may not have 'tpc' tag
+    return pc_directory(pdb).tpc()
 
 
 def import_zoom_email_single(pemail, sdb, all_tpc, pdb, zoom_emails):
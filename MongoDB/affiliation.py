@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import pickle
+import re
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+
+from findings import author_findings
+
+# Abbreviations expanded token by token, after punctuation is removed
+TOKEN_ALIASES = {
+    "univ": "university",
+    "uni": "university",
+    "u": "university",
+    "inst": "institute",
+    "tech": "technology",
+    "technol": "technology",
+    "natl": "national",
+    "nat": "national",
+    "lab": "laboratory",
+    "labs": "laboratories",
+    "corp": "corporation",
+    "inc": "",
+    "ltd": "",
+    "llc": "",
+    "the": "",
+    "dept": "department",
+    "sci": "science",
+    "res": "research",
+    "ctr": "center",
+    "centre": "center",
+}
+
+# Whole-name aliases, on normalized strings, extended with --alias_file
+INSTITUTION_ALIASES = {
+    "mit": "massachusetts institute of technology",
+    "cmu": "carnegie mellon university",
+    "ucsd": "university of california san diego",
+    "uc san diego": "university of california san diego",
+    "ucla": "university of california los angeles",
+    "uc berkeley": "university of california berkeley",
+    "ucb": "university of california berkeley",
+    "uc irvine": "university of california irvine",
+    "uci": "university of california irvine",
+    "ucsb": "university of california santa barbara",
+    "uc santa barbara": "university of california santa barbara",
+    "uc riverside": "university of california riverside",
+    "ucr": "university of california riverside",
+    "uc davis": "university of california davis",
+    "uiuc": "university of illinois urbana champaign",
+    "university of illinois at urbana champaign": "university of illinois urbana champaign",
+    "eth zurich": "eth zurich",
+    "ethz": "eth zurich",
+    "epfl": "ecole polytechnique federale de lausanne",
+    "kaist": "korea advanced institute of science and technology",
+    "gatech": "georgia institute of technology",
+    "georgia tech": "georgia institute of technology",
+    "ut austin": "university of texas at austin",
+    "umich": "university of michigan",
+    "msr": "microsoft research",
+}
+
+# Weakest rule wins when the author and PC sides matched through different keys
+RULES = ["normalized", "alias", "segment"]
+
+
+def norm_affiliation(affiliation):
+    """Lowercase, strip accents and punctuation, expand common abbreviations."""
+    a = unicodedata.normalize("NFKD", affiliation)
+    a = "".join(c for c in a if not unicodedata.combining(c)).lower()
+    a = a.replace("&", " and ")
+    a = re.sub(r"[^\w\s]", " ", a)
+    tokens = [TOKEN_ALIASES.get(t, t) for t in a.split()]
+    return " ".join(t for t in tokens if t)
+
+
+class affiliation_index:
+    """Normalized affiliation -> PC member index.
+
+    An affiliation has keys for the rules:
+      - normalized: the whole normalized string,
+      - alias:      the canonical name from INSTITUTION_ALIASES,
+      - segment:    each comma-separated part, e.g. "Microsoft Research" in
+                    "Microsoft Research, Redmond"; a segment only matches a
+                    whole affiliation on the other side.
+    """
+
+    def __init__(self, aliases=None):
+        self.logger = logging.getLogger("affiliation")
+        self.aliases = dict(INSTITUTION_ALIASES)
+        for k, v in (aliases or {}).items():
+            self.aliases[norm_affiliation(k)] = norm_affiliation(v)
+        self.whole = defaultdict(dict)
+        self.segments = defaultdict(dict)
+        self.affiliations = dict()
+        self.key_cache = dict()
+
+    def canonical(self, norm):
+        return self.aliases.get(norm, norm)
+
+    def keys(self, affiliation):
+        """Return ([(rule, whole key)], [segment keys]) for an affiliation."""
+        if affiliation in self.key_cache:
+            return self.key_cache[affiliation]
+        norm = norm_affiliation(affiliation)
+        whole = [("normalized", norm)] if norm else []
+        if norm and self.canonical(norm) != norm:
+            whole.append(("alias", self.canonical(norm)))
+        segments = []
+        parts = [norm_affiliation(s) for s in affiliation.split(",")]
+        if len(parts) > 1:
+            segments = [self.canonical(s) for s in parts if s]
+        self.key_cache[affiliation] = (whole, segments)
+        return whole, segments
+
+    def add(self, record):
+        affiliation = record.get("affiliation", "")
+        if not affiliation:
+            return
+        self.affiliations[record["email"]] = affiliation
+        whole, segments = self.keys(affiliation)
+        for rule, key in whole:
+            self.whole[key][record["email"]] = rule
+        for key in segments:
+            self.segments[key][record["email"]] = "segment"
+
+    def match(self, affiliation):
+        """Return {pc email: rule} of PC members with the same affiliation."""
+        whole, segments = self.keys(affiliation)
+        res = dict()
+
+        def update(email, rule):
+            if email not in res or RULES.index(rule) > RULES.index(res[email]):
+                res[email] = rule
+
+        for rule, key in whole:
+            for email, pc_rule in self.whole.get(key, {}).items():
+                update(email, max(rule, pc_rule, key=RULES.index))
+            for email in self.segments.get(key, {}):
+                update(email, "segment")
+        for key in segments:
+            for email in self.whole.get(key, {}):
+                update(email, "segment")
+        return res
+
+    def pairs(self, author, conflicts):
+        """Yield ("affiliation_<rule>", pc email, affiliations) of the PC
+        members sharing the author's affiliation, who are not declared as
+        conflicts."""
+        affiliation = author.get("affiliation", "")
+        if not affiliation:
+            return
+        for pc_email, rule in self.match(affiliation).items():
+            if pc_email in conflicts or pc_email == author.get("email", ""):
+                continue
+            yield f"affiliation_{rule}", pc_email, {
+                "author_affiliation": affiliation,
+                "pc_affiliation": self.affiliations[pc_email],
+            }
+
+    def check(self, sub):
+        """Return findings for authors sharing an affiliation with a PC member
+        not declared in pc_conflicts."""
+        return author_findings(sub, self.pairs)
+
+    def digest(self):
+        """Digest of the PC affiliations and aliases, cached results are only
+        valid for the same digest."""
+        data = json.dumps(
+            [sorted(self.affiliations.items()), sorted(self.aliases.items())]
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+
+def submission_digest(sub):
+    data = json.dumps(
+        [
+            [
+                [a.get(k) for k in ("first", "last", "email", "affiliation")]
+                for a in sub.get("authors", [])
+            ],
+            sorted(sub.get("pc_conflicts", {})),
+        ],
+        default=str,
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class affiliation_cache:
+    """Per-submission findings and normalized keys kept across runs.
+
+    A submission is re-checked only if its authors, affiliations or conflicts
+    changed since the last run, or if the PC index changed.
+    """
+
+    def __init__(self, cache_file, index):
+        self.logger = logging.getLogger("affiliation")
+        self.cache_file = cache_file
+        self.index = index
+        self.pc_digest = index.digest()
+        self.papers = dict()
+        self.hits = self.misses = 0
+        if cache_file and Path(cache_file).exists():
+            with open(cache_file, "rb") as f:
+                data = pickle.load(f)
+            if data.get("pc_digest") == self.pc_digest:
+                self.papers = data["papers"]
+                index.key_cache.update(data["keys"])
+            else:
+                self.logger.info("PC affiliations changed, re-checking all papers")
+            self.logger.info(
+                f"Loaded [{len(self.papers)}] cached papers from {cache_file}"
+            )
+
+    def check(self, sub):
+        digest = submission_digest(sub)
+        cached = self.papers.get(sub["_id"])
+        if cached and cached[0] == digest:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        findings = self.index.check(sub)
+        self.papers[sub["_id"]] = (digest, findings)
+        return findings
+
+    def save(self):
+        if not self.cache_file:
+            return
+        tmp_file = Path(f"{self.cache_file}.tmp")
+        with open(tmp_file, "wb") as f:
+            pickle.dump(
+                {
+                    "pc_digest": self.pc_digest,
+                    "papers": self.papers,
+                    "keys": self.index.key_cache,
+                },
+                f,
+            )
+        tmp_file.replace(self.cache_file)
+        self.logger.info(f"Saved [{len(self.papers)}] papers to {self.cache_file}")
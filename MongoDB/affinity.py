@@ -0,0 +1,104 @@
+import logging
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class affinity_matrix:
+    """Sparse submission x PC member affinity matrix.
+
+    Built in one pass over all submissions, from the PC papers cited by each
+    submission (see submission.py:check_pc_reference):
+      - papers[i, j]: number of distinct PC papers of member j cited by paper i,
+      - cited[i, j]:  number of citations to those papers, weighted by the
+                      title match score,
+      - conflicts[i, j]: 1 if member j is in pc_conflicts of paper i.
+    Tag overlap is computed from boolean paper x tag and PC x tag matrices.
+    Scores for new weights are then a few sparse/dense matrix operations.
+    """
+
+    def __init__(self, pcdir, pc_types=("tpc", "erc"), tag_fields=None):
+        self.logger = logging.getLogger("affinity")
+        self.pc_emails = [r["email"] for r in pcdir if r["pc_type"] in pc_types]
+        self.pc_index = {e: j for j, e in enumerate(self.pc_emails)}
+        self.tag_fields = list(tag_fields) if tag_fields else []
+        tag_index = {t: k for k, t in enumerate(self.tag_fields)}
+        self.pc_tags = np.zeros((len(self.pc_emails), len(self.tag_fields)), bool)
+        for j, e in enumerate(self.pc_emails):
+            for t in pcdir.tag_sets[e]:
+                if t in tag_index:
+                    self.pc_tags[j, tag_index[t]] = True
+        self.paper_ids = []
+        self.papers = self.cited = self.conflicts = self.paper_tags = None
+
+    def build(self, subs):
+        start = time.perf_counter()
+        tag_index = {t: k for k, t in enumerate(self.tag_fields)}
+        rows, cols, n_papers, n_cited = [], [], [], []
+        c_rows, c_cols = [], []
+        tag_rows, tag_cols = [], []
+        self.paper_ids = []
+        for i, sub in enumerate(subs):
+            self.paper_ids.append(sub["_id"])
+            for e in sub.get("pc_conflicts", {}):
+                if e in self.pc_index:
+                    c_rows.append(i)
+                    c_cols.append(self.pc_index[e])
+            for t in sub.get("tags", []):
+                if t in tag_index:
+                    tag_rows.append(i)
+                    tag_cols.append(tag_index[t])
+            for ref in sub.get("reference", []):
+                if not ref.get("pc_paper"):
+                    continue
+                weight = ref["count"] * ref.get("match_score", 1.0)
+                for p in ref["mag_record"]["PCAuthor"]:
+                    if p["email"] in self.pc_index:
+                        rows.append(i)
+                        cols.append(self.pc_index[p["email"]])
+                        n_papers.append(1)
+                        n_cited.append(weight)
+        shape = (len(self.paper_ids), len(self.pc_emails))
+        # Duplicated (row, col) entries are summed when converting to CSR
+        self.papers = csr_matrix((n_papers, (rows, cols)), shape=shape, dtype=float)
+        self.cited = csr_matrix((n_cited, (rows, cols)), shape=shape, dtype=float)
+        self.conflicts = csr_matrix(
+            (np.ones(len(c_rows)), (c_rows, c_cols)), shape=shape, dtype=bool
+        )
+        self.paper_tags = np.zeros((shape[0], len(self.tag_fields)), bool)
+        self.paper_tags[tag_rows, tag_cols] = True
+        self.logger.info(
+            f"Built [{shape[0]} x {shape[1]}] affinity matrix with "
+            f"[{self.papers.nnz}] non-zero entries in {time.perf_counter() - start:.2f}s"
+        )
+        return self
+
+    def scores(self, paper_weight=1.0, cited_weight=0.0, tag_weight=0.0):
+        """Dense score matrix, conflicted pairs are set to -inf."""
+        score = (paper_weight * self.papers + cited_weight * self.cited).toarray()
+        if tag_weight != 0 and len(self.tag_fields) > 0:
+            overlap = self.paper_tags.astype(float) @ self.pc_tags.T.astype(float)
+            score += tag_weight * overlap
+        score[self.conflicts.toarray()] = -np.inf
+        return score
+
+    def top_k(self, score, k=10):
+        """Return {paper id: [(email, score)]} of the k best non-conflicted
+        members with a positive score, best first."""
+        k = min(k, score.shape[1])
+        if k == 0:
+            return {pid: [] for pid in self.paper_ids}
+        best = np.argpartition(-score, k - 1, axis=1)[:, :k]
+        best_score = np.take_along_axis(score, best, axis=1)
+        order = np.argsort(-best_score, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_score = np.take_along_axis(best_score, order, axis=1)
+        res = dict()
+        for i, pid in enumerate(self.paper_ids):
+            res[pid] = [
+                (self.pc_emails[j], float(s))
+                for j, s in zip(best[i], best_score[i])
+                if s > 0
+            ]
+        return res
@@ -0,0 +1,87 @@
+import logging
+import time
+
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, linprog, milp
+from scipy.sparse import csr_matrix
+
+
+def solve_assignment(score, pc_types, paper_quota, load_limit):
+    """Assign reviewers to papers maximizing the total score.
+
+    score:       papers x pc members array, -inf for hard conflicts
+    pc_types:    type ("tpc" or "erc") of each pc member (column)
+    paper_quota: reviewers per paper for each type, e.g. {"tpc": 3, "erc": 1}
+    load_limit:  maximum reviews per pc member for each type, or an array with
+                 one limit per pc member
+
+    This is a bipartite b-matching, i.e. a min-cost-flow problem. Its
+    constraint matrix is totally unimodular, so the vertex solution found by
+    the HiGHS dual simplex is already integral; the MIP solver is only used as
+    a fallback. Returns a list of (paper index, pc member index), or raises if
+    the quotas cannot be met.
+    """
+    logger = logging.getLogger("assignment")
+    start = time.perf_counter()
+    types = list(paper_quota.keys())
+    pc_type_index = np.array(
+        [types.index(t) if t in types else -1 for t in pc_types], dtype=int
+    )
+    if isinstance(load_limit, dict):
+        limits = np.array([load_limit.get(t, 0) for t in pc_types], dtype=float)
+    else:
+        limits = np.asarray(load_limit, dtype=float)
+
+    # One variable per allowed (paper, reviewer) pair
+    allowed = np.isfinite(score) & (pc_type_index >= 0)[np.newaxis, :]
+    rows, cols = np.nonzero(allowed)
+    n_vars = len(rows)
+    n_papers, n_pc = score.shape
+    var = np.arange(n_vars)
+
+    # Paper constraints: one row per (paper, type), then one row per reviewer
+    paper_rows = rows * len(types) + pc_type_index[cols]
+    pc_rows = n_papers * len(types) + cols
+    A = csr_matrix(
+        (
+            np.ones(2 * n_vars),
+            (np.concatenate([paper_rows, pc_rows]), np.concatenate([var, var])),
+        ),
+        shape=(n_papers * len(types) + n_pc, n_vars),
+    )
+    quota = np.tile([paper_quota[t] for t in types], n_papers).astype(float)
+    lb = np.concatenate([quota, np.zeros(n_pc)])
+    ub = np.concatenate([quota, limits])
+
+    c = -score[rows, cols]
+    eq = lb == ub
+    res = linprog(
+        c,
+        A_ub=A[~eq],
+        b_ub=ub[~eq],
+        A_eq=A[eq],
+        b_eq=lb[eq],
+        bounds=(0, 1),
+        method="highs-ds",
+    )
+    if res.success and np.any(np.abs(res.x - np.round(res.x)) > 1e-6):
+        logger.warning("LP solution is fractional, solving as MIP instead")
+        res = milp(
+            c=c,
+            constraints=LinearConstraint(A, lb, ub),
+            integrality=np.ones(n_vars),
+            bounds=Bounds(0, 1),
+        )
+    if not res.success:
+        raise Exception(
+            f"Cannot find a review assignment: {res.message}. "
+            f"Check that load limits are large enough for the quotas, "
+            f"and that every paper has enough non-conflicted reviewers"
+        )
+    chosen = res.x > 0.5
+    logger.info(
+        f"Assigned [{chosen.sum()}] reviews over [{n_papers} x {n_pc}] pairs "
+        f"([{n_vars}] allowed), total score {-res.fun:.2f}, "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+    return list(zip(rows[chosen].tolist(), cols[chosen].tolist()))
@@ -0,0 +1,74 @@
+import logging
+import time
+
+from pymongo import UpdateOne
+
+
+class bulk_writer:
+    """Accumulate write operations and send them as unordered bulk_write batches.
+
+    Usage:
+        with bulk_writer(pdb, batch_size=1000) as bw:
+            bw.update_one({"_id": 1}, {"$set": {"a": 1}}, upsert=True)
+    """
+
+    def __init__(self, db, batch_size=1000, ordered=False, name=None, depends_on=None):
+        self.logger = logging.getLogger("bulk")
+        self.db = db
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.name = name if name else f"{db.database}:{db.collection}"
+        # Writers whose queued operations are sent before each batch of this one
+        self.depends_on = depends_on if depends_on else []
+        self.ops = []
+        self.batches = 0
+        self.total = {"ops": 0, "upserted": 0, "modified": 0, "matched": 0}
+        self.start_time = time.perf_counter()
+
+    def add(self, op):
+        self.ops.append(op)
+        if len(self.ops) >= self.batch_size:
+            self.flush()
+
+    def update_one(self, filter, update, upsert=False):
+        self.add(UpdateOne(filter, update, upsert=upsert))
+
+    def flush(self):
+        if len(self.ops) == 0:
+            return
+        for w in self.depends_on:
+            w.flush()
+        ops = self.ops
+        self.ops = []
+        start = time.perf_counter()
+        res = self.db.client.bulk_write(ops, ordered=self.ordered)
+        elapsed = time.perf_counter() - start
+        self.batches += 1
+        self.total["ops"] += len(ops)
+        self.total["upserted"] += res.upserted_count
+        self.total["modified"] += res.modified_count
+        self.total["matched"] += res.matched_count
+        self.logger.info(
+            f"[{self.name}] Batch [{self.batches:>4}]: [{len(ops):>6}] ops, "
+            f"upserted [{res.upserted_count:>6}], modified [{res.modified_count:>6}], "
+            f"{elapsed:.2f}s"
+        )
+
+    def close(self):
+        self.flush()
+        elapsed = time.perf_counter() - self.start_time
+        throughput = self.total["ops"] / elapsed if elapsed > 0 else 0
+        self.logger.info(
+            f"[{self.name}] Total: [{self.total['ops']}] ops in [{self.batches}] batches, "
+            f"upserted [{self.total['upserted']}], modified [{self.total['modified']}], "
+            f"{elapsed:.2f}s ({throughput:.0f} ops/s)"
+        )
+        return self.total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Do not send a partial batch if the producer failed
+        if exc_type is None:
+            self.close()
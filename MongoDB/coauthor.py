@@ -0,0 +1,77 @@
+import logging
+import time
+from collections import defaultdict
+
+from findings import author_findings
+from Utils.names import canonical_name
+
+
+def paper_year(paper):
+    try:
+        return int(paper.get("year", ""))
+    except ValueError:
+        return None
+
+
+class coauthor_graph:
+    """Co-author adjacency index built from PC publications in dblp:paper.
+
+    adjacency[normalized co-author name][pc email] is the latest year they
+    published together, only publications since since_year are included.
+    """
+
+    def __init__(self, since_year=None):
+        self.logger = logging.getLogger("coauthor")
+        self.since_year = since_year
+        self.adjacency = defaultdict(dict)
+        self.papers = 0
+
+    def add(self, paper):
+        year = paper_year(paper)
+        if self.since_year and (year is None or year < self.since_year):
+            return
+        self.papers += 1
+        authors = [canonical_name(a) for a in paper.get("author", [])]
+        for pc in paper.get("PCAuthor", []):
+            pc_name = canonical_name(pc["name"])
+            for a in authors:
+                if a == pc_name:
+                    continue
+                edges = self.adjacency[a]
+                # 0 stands for an unknown year, it never replaces a known one
+                if pc["email"] not in edges or (year or 0) > edges[pc["email"]]:
+                    edges[pc["email"]] = year or 0
+
+    def build(self, ddb):
+        start = time.perf_counter()
+        projection = {"author": 1, "year": 1, "PCAuthor": 1}
+        for paper in ddb.client.find({"PCAuthor": {"$exists": True}}, projection):
+            self.add(paper)
+        self.logger.info(
+            f"Built co-author graph of [{len(self.adjacency)}] co-authors from "
+            f"[{self.papers}] papers since [{self.since_year}] "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return self
+
+    def coauthors(self, first, last):
+        """Return {pc email: latest year} of PC members who co-authored with
+        this person."""
+        return self.adjacency.get(canonical_name(f"{first} {last}"), {})
+
+    def pairs(self, author, conflicts):
+        """Yield ("coauthor", pc email, {"year": latest year}) of the PC
+        members an author co-authored with, who are not declared as
+        conflicts."""
+        if "first" not in author or "last" not in author:
+            return
+        coauthors = self.coauthors(author["first"], author["last"])
+        for pc_email, year in coauthors.items():
+            if pc_email in conflicts or pc_email == author.get("email", ""):
+                continue
+            yield "coauthor", pc_email, {"year": year}
+
+    def check(self, sub):
+        """Return findings for submission authors who co-authored with a PC
+        member not declared in pc_conflicts."""
+        return author_findings(sub, self.pairs)
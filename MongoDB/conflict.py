@@ -1,16 +1,30 @@
 import contextlib
-import copy
-import csv
+import datetime
+import inspect
 import json
 import logging
 import os
 import re
+import sys
+from collections import Counter
 from pathlib import Path
 
 import click
-from fuzzywuzzy import process
 
+# To import a module from parent dir
+# https://stackoverflow.com/questions/714063/importing-modules-from-parent-folder
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+from affiliation import RULES, affiliation_cache, affiliation_index
+from coauthor import coauthor_graph
+from conflict_index import conflict_index
+from conflict_matrix import make_conflict_matrix
+from findings import check_submissions
+from pc_directory import pc_directory
 from utils import make_mongodb
+from Utils.utils import option_group
 
 log_format = logging.Formatter(
     "[%(asctime)s][%(filename)s:%(lineno)4s - %(funcName)10s()] %(message)s"
@@ -29,101 +43,228 @@ def conflict():
     pass
 
 
-@conflict.command()
-@click.option("-i", "--submission_id", type=int)
-@click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+# Options shared by the checks writing findings
+check_options = option_group(
+    click.option("-i", "--submission_id", type=int),
+    click.option(
+        "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+    ),
+    click.option(
+        "-o",
+        "--out_file",
+        type=click.Path(dir_okay=False),
+        help="Write findings to this .json or .csv file",
+    ),
 )
-@click.option("-m", "--mag_dbcol_name", required=True, default="mag:paper")
+
+# Options shared by the conflict matrix queries
+matrix_options = option_group(
+    click.option(
+        "-s",
+        "--submission_dbcol_name",
+        required=True,
+        default="hotcrp:submission",
+    ),
+    click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc"),
+    click.option(
+        "-x",
+        "--matrix_file",
+        type=click.Path(dir_okay=False),
+        help="Load the conflict matrix from this file, build and save it if absent",
+    ),
+    click.option("--rebuild", is_flag=True, help="Rebuild the matrix file"),
+)
+
+
+@conflict.command()
+@check_options
 @click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
-@click.option("-f", "--force", is_flag=True)
+@click.option("-c", "--score_cutoff", type=int, default=90, show_default=True)
 def check_author_in_conflict(
-    submission_id, submission_dbcol_name, mag_dbcol_name, pcmember_dbcol_name, force
+    submission_id,
+    submission_dbcol_name,
+    pcmember_dbcol_name,
+    out_file,
+    score_cutoff,
 ):
     """Check if a submission's author is specified as a conflict"""
     sdb = make_mongodb(submission_dbcol_name)
-    mdb = make_mongodb(mag_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
 
-    all_pc = pdb.client.find()
+    logger = logging.getLogger()
+    cindex = conflict_index(pc_directory(pdb), score_cutoff)
+
+    papers, findings = check_submissions(sdb, submission_id, cindex.check, out_file)
 
-    if submission_id:
-        check_author_in_conflict_single(submission_id, sdb, mdb, pdb, all_pc, force)
-    else:
-        ids = sdb.client.find().distinct("_id")
-        for sid in ids:
-            check_author_in_conflict_single(
-                sid, sdb, mdb, pdb, copy.deepcopy(all_pc), force
-            )
+    rules = Counter(f["rule"] for f in findings)
+    logger.info(
+        f"Checked [{papers}] papers, found [{len(findings)}] undeclared "
+        f"conflicts: {dict(rules)}"
+    )
 
 
 @conflict.command()
+@check_options
+@click.option("-d", "--dblp_paper_dbcol_name", required=True, default="dblp:paper")
 @click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+    "-y",
+    "--years",
+    type=int,
+    default=2,
+    show_default=True,
+    help="Only count co-authorship in the last N years (0 for all)",
 )
+@click.option("--since_year", type=int, help="Overrides --years")
+def check_coauthor_conflict(
+    submission_id,
+    submission_dbcol_name,
+    dblp_paper_dbcol_name,
+    years,
+    since_year,
+    out_file,
+):
+    """Check if a submission's author co-authored with an undeclared PC member"""
+    sdb = make_mongodb(submission_dbcol_name)
+    ddb = make_mongodb(dblp_paper_dbcol_name)
+
+    logger = logging.getLogger()
+    if since_year is None and years > 0:
+        since_year = datetime.date.today().year - years + 1
+    graph = coauthor_graph(since_year).build(ddb)
+
+    papers, findings = check_submissions(sdb, submission_id, graph.check, out_file)
+
+    logger.info(
+        f"Checked [{papers}] papers, found [{len(findings)}] undeclared "
+        f"co-author conflicts in [{len(set(f['paper'] for f in findings))}] papers"
+    )
+
+
+@conflict.command()
+@check_options
 @click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
-def find_chair_conflict_papers(submission_dbcol_name, pcmember_dbcol_name):
-    """Find papers that specify all chairs as conflicts"""
+@click.option(
+    "-x",
+    "--cache_file",
+    type=click.Path(dir_okay=False),
+    help="Keep per-paper results here, only changed papers are re-checked",
+)
+@click.option("--rebuild_cache", is_flag=True)
+@click.option(
+    "-a",
+    "--alias_file",
+    type=click.Path(exists=True, dir_okay=False),
+    help='JSON object of extra institution aliases, e.g. {"SJTU": "..."}',
+)
+def check_affiliation_conflict(
+    submission_id,
+    submission_dbcol_name,
+    pcmember_dbcol_name,
+    cache_file,
+    rebuild_cache,
+    alias_file,
+    out_file,
+):
+    """Check if a submission's author is in the same institution as an
+    undeclared PC member"""
     sdb = make_mongodb(submission_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
 
     logger = logging.getLogger()
+    aliases = None
+    if alias_file:
+        with open(alias_file, "r") as f:
+            aliases = json.load(f)
+    aindex = affiliation_index(aliases)
+    for r in pc_directory(pdb):
+        aindex.add(r)
+    if rebuild_cache and cache_file and Path(cache_file).exists():
+        Path(cache_file).unlink()
+    acache = affiliation_cache(cache_file, aindex)
 
-    all_chairs = list(
-        pdb.client.find({"roles": {"$regex": r".*chair.*"}}, {"name": 1, "email": 1})
+    papers, findings = check_submissions(sdb, submission_id, acache.check, out_file)
+    acache.save()
+    rules = Counter(f["rule"] for f in findings)
+    logger.info(
+        f"Checked [{papers}] papers ([{acache.misses}] re-checked, "
+        f"[{acache.hits}] cached), found [{len(findings)}] undeclared "
+        f"affiliation conflicts"
     )
+    for rule in RULES:
+        logger.info(f"    {rule:<10}: {rules[f'affiliation_{rule}']:>5} hits")
 
-    all_papers = list(sdb.client.find())
-    for p in all_papers:
-        all_conflict = True
-        for c in all_chairs:
-            if c["email"] not in p["pc_conflicts"]:
-                all_conflict = False
-                break
-        if all_conflict:
-            logger.info(f"Paper [{p['_id']:>4}] is conflict with all chairs")
+
+@conflict.command()
+@matrix_options
+def find_chair_conflict_papers(
+    submission_dbcol_name, pcmember_dbcol_name, matrix_file, rebuild
+):
+    """Find papers that specify all chairs as conflicts"""
+    logger = logging.getLogger()
+    matrix = make_conflict_matrix(
+        submission_dbcol_name, pcmember_dbcol_name, matrix_file, rebuild
+    )
+    for pid in matrix.all_chairs_conflict():
+        logger.info(f"Paper [{pid:>4}] is conflict with all chairs")
 
 
-def check_author_in_conflict_single(sid, sdb, mdb, pdb, all_pc, force=False):
+@conflict.command()
+@matrix_options
+@click.option(
+    "-k",
+    "--min_reviewers",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Report papers with fewer non-conflicted members sharing a tag",
+)
+@click.option("-t", "--pc_type", type=click.Choice(["tpc", "erc"]), default="tpc")
+def find_low_coverage_papers(
+    submission_dbcol_name,
+    pcmember_dbcol_name,
+    matrix_file,
+    rebuild,
+    min_reviewers,
+    pc_type,
+):
+    """Find papers with fewer than k non-conflicted PC members sharing a tag"""
     logger = logging.getLogger()
-    logger.info(f"Checking paper [{sid:>4}]")
-    sub = sdb.client.find_one({"_id": sid})
-    assert sub is not None
-
-    # 1. Check by email
-    all_pc_email = set([p["email"] for p in copy.deepcopy(all_pc)])
-    for author in sub["authors"]:
-        if "email" not in author:
-            logger.error(f"    Author does not have email field: {author}")
-            continue
-        email = author["email"]
-        if email in all_pc_email:
-            if email not in sub["pc_conflicts"]:
-                logger.error(
-                    f"    [ERROR][Detected by email] Author is PC but not declared as conflict: {author}"
-                )
-    # 2. Check by name
-    all_pc_name = [(p["first"] + " " + p["last"]) for p in copy.deepcopy(all_pc)]
-    for author in sub["authors"]:
-        if "first" not in author or "last" not in author:
-            logger.error(f"    Author does not have first/last name field: {author}")
-            continue
-        name = f"{author['first']} {author['last']}"
-        name_best_match = process.extractOne(name, all_pc_name, score_cutoff=90)
-        logger.debug(f"    Best name match: {name} == {name_best_match}")
-        if name_best_match:
-            for p in copy.deepcopy(all_pc):
-                if (p["first"] + " " + p["last"]) == name_best_match[0]:
-                    pc_email = p["email"]
-            if pc_email not in sub["pc_conflicts"]:
-                logger.error(
-                    f"    [ERROR][Detected by name ] Author is PC but not declared as conflict: \n\tPC Member: {name_best_match}\n\tAuthor: {author}"
-                )
-            if "email" in author:
-                if author["email"] not in sub["pc_conflicts"]:
-                    logger.info(
-                        f"    [INFO ][Detected by name ] Author is PC but using different email from PC profile: {author}"
-                    )
+    matrix = make_conflict_matrix(
+        submission_dbcol_name, pcmember_dbcol_name, matrix_file, rebuild
+    )
+    res = matrix.low_coverage(min_reviewers, pc_type)
+    for pid, count in res:
+        logger.info(
+            f"Paper [{pid:>4}] has [{count}] non-conflicted {pc_type} members "
+            f"sharing a tag: {matrix.paper_tags[pid]}"
+        )
+    logger.info(f"Found [{len(res)}] papers with less than {min_reviewers} members")
+
+
+@conflict.command()
+@matrix_options
+@click.option(
+    "-n",
+    "--max_conflicts",
+    type=int,
+    default=20,
+    show_default=True,
+    help="Report PC members with more conflicts",
+)
+def find_busy_conflict_pc(
+    submission_dbcol_name, pcmember_dbcol_name, matrix_file, rebuild, max_conflicts
+):
+    """Find PC members that are conflicted with more than N papers"""
+    logger = logging.getLogger()
+    matrix = make_conflict_matrix(
+        submission_dbcol_name, pcmember_dbcol_name, matrix_file, rebuild
+    )
+    res = matrix.busy_members(max_conflicts)
+    for email, count in res:
+        logger.info(f"PC member [{email:40}] is conflict with [{count:>4}] papers")
+    logger.info(
+        f"Found [{len(res)}] PC members with more than {max_conflicts} conflicts"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import logging
+from collections import defaultdict
+
+from findings import author_findings
+from Utils.names import canonical_name, name_similarity
+
+
+def blocking_keys(first, last):
+    """Keys of the buckets a name falls in, fuzzy matches are only searched
+    within the same buckets: same last name, or same first initial and same
+    first two letters of the last name."""
+    first = canonical_name(first)
+    last = canonical_name(last)
+    keys = [f"last:{last}"]
+    if first and last:
+        keys.append(f"initial:{first[0]}:{last[:2]}")
+    return keys
+
+
+class conflict_index:
+    """Email and normalized-name indexes over all PC members, built once."""
+
+    def __init__(self, pc_records, score_cutoff=90):
+        self.logger = logging.getLogger("conflict_index")
+        self.score_cutoff = score_cutoff
+        self.emails = dict()
+        self.names = dict()
+        self.buckets = defaultdict(set)
+        for p in pc_records:
+            self.emails[p["email"].lower()] = p["email"]
+            name = canonical_name(f'{p["first"]} {p["last"]}')
+            self.names[name] = p["email"]
+            for key in blocking_keys(p["first"], p["last"]):
+                self.buckets[key].add(name)
+
+    def match_email(self, email):
+        return self.emails.get(email.lower())
+
+    def match_name(self, first, last):
+        """Return (pc email, score) of the best matching pc member, or None."""
+        name = canonical_name(f"{first} {last}")
+        if name in self.names:
+            return self.names[name], 100
+        candidates = set()
+        # Also look up swapped names, first and last are often mixed up
+        for key in blocking_keys(first, last) + blocking_keys(last, first):
+            candidates |= self.buckets.get(key, set())
+        best, best_score = None, 0
+        for c in candidates:
+            # Same scorer as process.extractOne, which reordered names need
+            score = name_similarity(name, c, scorer="wratio")
+            if score > best_score:
+                best, best_score = c, score
+        if best is None or best_score < self.score_cutoff:
+            return None
+        return self.names[best], best_score
+
+    def pairs(self, author, conflicts):
+        """Yield (rule, pc email, extra fields) of the PC members an author
+        is, by email or by name, who are not declared as conflicts."""
+        # 1. Check by email
+        if "email" not in author:
+            self.logger.error(f"    Author does not have email field: {author}")
+        else:
+            pc_email = self.match_email(author["email"])
+            if pc_email and pc_email not in conflicts:
+                yield "email", pc_email, {"score": 100}
+        # 2. Check by name
+        if "first" not in author or "last" not in author:
+            self.logger.error(f"    Author does not have first/last name field: {author}")
+            return
+        match = self.match_name(author["first"], author["last"])
+        if not match:
+            return
+        pc_email, score = match
+        if pc_email not in conflicts:
+            yield "name", pc_email, {"score": score}
+        elif "email" in author and author["email"] not in conflicts:
+            yield "name_different_email", pc_email, {"score": score}
+
+    def check(self, sub):
+        """Return all PC members among the authors of a submission who are not
+        declared as conflicts, as a list of findings."""
+        return author_findings(sub, self.pairs)
@@ -0,0 +1,150 @@
+import logging
+import pickle
+import time
+from pathlib import Path
+
+from pc_directory import pc_directory
+from utils import make_mongodb
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+class conflict_matrix:
+    """Submission x PC member conflict matrix, stored as bitsets.
+
+    Bit j of papers[pid] is set if PC member roster[j] is in pc_conflicts of
+    paper pid, and bit i of members[email] is set if paper paper_ids[i] lists
+    the member as a conflict. Masks over the roster (chairs, pc types, tags)
+    are kept with the matrix, so that loading it from disk needs no database
+    query.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("conflict_matrix")
+        self.roster = []
+        self.roster_index = dict()
+        self.chair_mask = 0
+        self.type_masks = dict()
+        self.tag_masks = dict()
+        self.paper_ids = []
+        self.papers = dict()
+        self.paper_tags = dict()
+        self.members = dict()
+
+    def add_pc(self, record, is_chair=False):
+        email = record["email"]
+        bit = 1 << len(self.roster)
+        self.roster_index[email] = len(self.roster)
+        self.roster.append(email)
+        if is_chair:
+            self.chair_mask |= bit
+        pc_type = record.get("pc_type")
+        self.type_masks[pc_type] = self.type_masks.get(pc_type, 0) | bit
+        for t in record.get("tags", []):
+            self.tag_masks[t] = self.tag_masks.get(t, 0) | bit
+        self.members[email] = 0
+
+    def add_paper(self, sub):
+        pid = sub["_id"]
+        pbit = 1 << len(self.paper_ids)
+        self.paper_ids.append(pid)
+        bits = 0
+        for email in sub.get("pc_conflicts", {}):
+            if email in self.roster_index:
+                bits |= 1 << self.roster_index[email]
+                self.members[email] |= pbit
+        self.papers[pid] = bits
+        self.paper_tags[pid] = list(sub.get("tags", []))
+
+    @classmethod
+    def from_collection(cls, sdb, pcdir):
+        start = time.perf_counter()
+        matrix = cls()
+        for r in pcdir:
+            matrix.add_pc(r, pcdir.is_chair(r["email"]))
+        for sub in sdb.client.find({}, {"pc_conflicts": 1, "tags": 1}):
+            matrix.add_paper(sub)
+        matrix.logger.info(
+            f"Built [{len(matrix.paper_ids)} x {len(matrix.roster)}] conflict "
+            f"matrix in {time.perf_counter() - start:.2f}s"
+        )
+        return matrix
+
+    def type_mask(self, pc_type):
+        mask = self.type_masks.get(pc_type, 0)
+        if pc_type == "tpc":
+            # Chairs may not have the 'tpc' tag, see pc_directory.tpc()
+            mask |= self.chair_mask
+        return mask
+
+    def all_chairs_conflict(self):
+        """Papers that list every chair as a conflict."""
+        return [
+            pid
+            for pid in self.paper_ids
+            if self.papers[pid] & self.chair_mask == self.chair_mask
+        ]
+
+    def coverage(self, pid, pc_type="tpc"):
+        """Bitset of non-conflicted members of pc_type sharing a tag with pid."""
+        tags = 0
+        for t in self.paper_tags[pid]:
+            tags |= self.tag_masks.get(t, 0)
+        return tags & self.type_mask(pc_type) & ~self.papers[pid]
+
+    def low_coverage(self, k, pc_type="tpc"):
+        """Return [(pid, count)] of papers with fewer than k non-conflicted
+        members of pc_type sharing a tag with the paper."""
+        res = []
+        for pid in self.paper_ids:
+            count = popcount(self.coverage(pid, pc_type))
+            if count < k:
+                res.append((pid, count))
+        return res
+
+    def busy_members(self, n):
+        """Return [(email, count)] of PC members with more than n conflicts."""
+        res = []
+        for email in self.roster:
+            count = popcount(self.members[email])
+            if count > n:
+                res.append((email, count))
+        return sorted(res, key=lambda x: -x[1])
+
+    @classmethod
+    def load(cls, matrix_file):
+        matrix = cls()
+        with open(matrix_file, "rb") as f:
+            matrix.__dict__.update(pickle.load(f))
+        matrix.logger = logging.getLogger("conflict_matrix")
+        matrix.logger.info(
+            f"Loaded [{len(matrix.paper_ids)} x {len(matrix.roster)}] conflict "
+            f"matrix from {matrix_file}"
+        )
+        return matrix
+
+    def save(self, matrix_file):
+        data = {k: v for k, v in self.__dict__.items() if k != "logger"}
+        tmp_file = Path(f"{matrix_file}.tmp")
+        with open(tmp_file, "wb") as f:
+            pickle.dump(data, f)
+        tmp_file.replace(matrix_file)
+        self.logger.info(f"Saved conflict matrix to {matrix_file}")
+
+
+def make_conflict_matrix(
+    submission_dbcol_name, pcmember_dbcol_name, matrix_file=None, rebuild=False
+):
+    """Load the conflict matrix from matrix_file if present, otherwise build it
+    from the submission and PC collections. Loading does not connect to the
+    database."""
+    if matrix_file and Path(matrix_file).exists() and not rebuild:
+        return conflict_matrix.load(matrix_file)
+    sdb = make_mongodb(submission_dbcol_name)
+    pdb = make_mongodb(pcmember_dbcol_name)
+    matrix = conflict_matrix.from_collection(sdb, pc_directory(pdb))
+    if matrix_file:
+        matrix.save(matrix_file)
+    return matrix
@@ -0,0 +1,18 @@
+from title_index import norm_title
+from Utils.names import split_bib_authors
+
+
+def dblp_paper_record(entry):
+    """Convert a DBLP bibtex entry into a dblp:paper document, in place.
+
+    The bibtex key becomes _id, editors stand in for authors of proceedings,
+    the author field becomes a list of names and the title
+    is normalized for matching.
+    """
+    p = entry
+    p["_id"] = p.pop("ID")
+    if "editor" in p and "author" not in p:
+        p["author"] = p["editor"]
+    p["author"] = split_bib_authors(p["author"])
+    p["title"] = norm_title(p.pop("title"))
+    return p
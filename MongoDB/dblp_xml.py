@@ -0,0 +1,133 @@
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+
+from lxml import etree
+
+from Utils.names import canonical_name
+
+# Top-level publication records of dblp.xml, person pages are "www" records
+PUBLICATION_TAGS = (
+    "article",
+    "inproceedings",
+    "proceedings",
+    "book",
+    "incollection",
+    "phdthesis",
+    "mastersthesis",
+)
+
+
+def dblp_pid(url):
+    """Return the pid of a DBLP person URL, e.g. "12/345" for
+    https://dblp.org/pid/12/345.html, or None."""
+    m = re.search(r"/pid/(.+?)(?:\.html|\.bib|\.xml)?/?$", url or "")
+    return m.group(1) if m else None
+
+
+def iter_dblp_records(xml_file, tags=PUBLICATION_TAGS):
+    """Yield the top-level records of a dblp.xml(.gz) dump with bounded memory.
+
+    dblp.dtd, needed for the character entities, must be in the same directory
+    as the dump. Each record is cleared, and detached from the root, once the
+    caller is done with it.
+    """
+    opener = gzip.open if str(xml_file).endswith(".gz") else open
+    with opener(xml_file, "rb") as f:
+        # The file name of f is used to find dblp.dtd
+        context = etree.iterparse(
+            f,
+            events=("end",),
+            tag=tags,
+            load_dtd=True,
+            resolve_entities=True,
+            huge_tree=True,
+        )
+        for _, elem in context:
+            yield elem
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def resolve_pid_names(xml_file, pids, cache_file=None):
+    """Return {pid: [DBLP names]} from the homepages/<pid> records of the dump.
+
+    This needs a pass over the whole dump, results are kept in cache_file and
+    the pass is only done again for pids not found there.
+    """
+    logger = logging.getLogger("dblp_xml")
+    cached = dict()
+    if cache_file and os.path.exists(cache_file):
+        with open(cache_file, "r") as f:
+            cached = json.load(f)
+    missing = set(pids) - set(cached)
+    if missing:
+        start = time.perf_counter()
+        logger.info(f"Resolving [{len(missing)}] DBLP pids from {xml_file}")
+        keys = {f"homepages/{pid}": pid for pid in missing}
+        for elem in iter_dblp_records(xml_file, tags=("www",)):
+            pid = keys.get(elem.get("key"))
+            if pid:
+                cached[pid] = [a.text for a in elem.iter("author") if a.text]
+        logger.info(f"Resolved pids in {time.perf_counter() - start:.1f}s")
+        for pid in set(missing) - set(cached):
+            logger.warning(f"DBLP pid [{pid}] not found in the dump")
+        if cache_file:
+            with open(cache_file, "w") as f:
+                json.dump(cached, f, ensure_ascii=False, indent=4)
+    return {pid: cached[pid] for pid in pids if pid in cached}
+
+
+class pc_matcher:
+    """Find PC members among the authors of a DBLP record.
+
+    Members with a DBLP pid are matched on the exact names of their DBLP
+    person page, members without one on their normalized name.
+    """
+
+    def __init__(self, members, pid_names):
+        self.exact = defaultdict(list)
+        self.normalized = defaultdict(list)
+        for m in members:
+            # Members imported by pc_member only have first and last names
+            name = m.get("name") or f'{m["first"]} {m["last"]}'
+            pa = {"name": name, "email": m["email"]}
+            pid = dblp_pid(m.get("dblp"))
+            if pid in pid_names:
+                for name in pid_names[pid]:
+                    self.exact[name].append(pa)
+            else:
+                self.normalized[canonical_name(name)].append(pa)
+
+    def match(self, names):
+        res = []
+        for name in names:
+            for pa in self.exact.get(name, []):
+                res.append(pa)
+            if self.normalized:
+                for pa in self.normalized.get(canonical_name(name), []):
+                    res.append(pa)
+        return res
+
+
+def dblp_xml_entry(elem):
+    """Convert a dblp.xml record into a bibtexparser-like entry, with the
+    fields kept by DBLP/bib.py, for MongoDB/dblp_paper.py."""
+    entry = {"ID": f'DBLP:{elem.get("key")}', "ENTRYTYPE": elem.tag}
+    for field in ("author", "editor"):
+        names = ["".join(e.itertext()) for e in elem.iter(field)]
+        if names:
+            entry[field] = " and\n".join(names)
+    for field in ("title", "year", "booktitle", "journal"):
+        e = elem.find(field)
+        if e is not None:
+            entry[field] = "".join(e.itertext())
+    if "title" in entry:
+        # dblp.xml titles end with a period, the .bib ones do not
+        entry["title"] = entry["title"].strip().rstrip(".").rstrip()
+    return entry
@@ -0,0 +1,67 @@
+import csv
+import json
+import logging
+from pathlib import Path
+
+
+def author_findings(sub, pairs):
+    """Return the findings of a submission, one per (author, PC member) pair.
+
+    pairs(author, conflicts) yields (rule, pc email, extra fields) for each PC
+    member the author is in conflict with, conflicts being the pc_conflicts
+    declared by the submission.
+    """
+    findings = []
+    conflicts = sub.get("pc_conflicts", {})
+    for author in sub.get("authors", []):
+        for rule, pc_email, extra in pairs(author, conflicts):
+            findings.append(
+                {
+                    "paper": sub["_id"],
+                    "author_first": author.get("first", ""),
+                    "author_last": author.get("last", ""),
+                    "author_email": author.get("email", ""),
+                    "rule": rule,
+                    "pc_email": pc_email,
+                    **extra,
+                }
+            )
+    return findings
+
+
+def check_submissions(sdb, submission_id, check, out_file=None):
+    """Run check(sub) -> [findings] on one submission, or on all of them in
+    one projected query, and write the findings to out_file if given.
+
+    Return (number of papers checked, findings).
+    """
+    logger = logging.getLogger()
+    query = {"_id": submission_id} if submission_id else {}
+    projection = {"authors": 1, "pc_conflicts": 1}
+    findings = []
+    papers = 0
+    for sub in sdb.client.find(query, projection):
+        papers += 1
+        findings.extend(check(sub))
+    if submission_id and papers == 0:
+        raise Exception(f"Submission [{submission_id}] not found")
+
+    for f in findings:
+        logger.debug(f"    [{f['paper']:>4}][{f['rule']}] {f}")
+    if out_file:
+        write_findings(findings, out_file)
+        logger.info(f"Findings written to {out_file}")
+    return papers, findings
+
+
+def write_findings(findings, out_file):
+    """Write a list of finding dicts as JSON or CSV, by file extension."""
+    if Path(out_file).suffix == ".csv":
+        columns = list(findings[0].keys()) if findings else ["paper", "rule"]
+        with open(out_file, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(findings)
+    else:
+        with open(out_file, "w") as f:
+            json.dump(findings, f, indent=2)
@@ -1,22 +1,35 @@
 import contextlib
 import csv
+import inspect
 import json
 import logging
 import os
 import re
+import sys
+import time
 from pathlib import Path
 from xmlrpc.client import Boolean, boolean
 
 import click
 import pandas as pd
-from utils import make_mongodb, mongodb
 
-def norm_title(title):
-    t = title
-    t = t.lower()
-    t = re.sub(r"\W", " ", t)
-    t = re.sub(r"\s+", " ", t)
-    return t
+# To import a module from parent dir
+# https://stackoverflow.com/questions/714063/importing-modules-from-parent-folder
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+from bulk import bulk_writer
+from dblp_paper import dblp_paper_record
+from dblp_xml import (
+    dblp_pid,
+    dblp_xml_entry,
+    iter_dblp_records,
+    pc_matcher,
+    resolve_pid_names,
+)
+from stream import iter_json_array
+from utils import make_mongodb, mongodb
 
 log_format = logging.Formatter(
     "[%(asctime)s][%(filename)s:%(lineno)4s - %(funcName)10s()] %(message)s"
@@ -41,8 +54,20 @@ def dbimport():
 @click.option("-p", "--paper_dbcol_name", default="dblp:paper")
 @click.option("-n", "--number_of_authors", type=int, default=1)
 @click.option("--all_members", is_flag=True)
+@click.option(
+    "-b",
+    "--batch_size",
+    type=int,
+    default=1000,
+    help="Number of operations per bulk_write batch",
+)
 def dblp(
-    dblp_file, author_dbcol_name, paper_dbcol_name, number_of_authors, all_members
+    dblp_file,
+    author_dbcol_name,
+    paper_dbcol_name,
+    number_of_authors,
+    all_members,
+    batch_size,
 ):
     logger = logging.getLogger()
     with open(dblp_file, "r") as f:
@@ -55,45 +80,123 @@ def dblp(
     db, col = paper_dbcol_name.split(":")
     pdb = mongodb(db, col)
 
-    for d in data:
-        logger.info(f'Importing author [{d["name"]:30}]')
-        # Update author
-        author = {
-            "_id": d["email"],
-            "name": d["name"],
-            "email": d["email"],
-            "dblp": d["dblp"],
-            "google_scholar": d["google_scholar"],
-        }
-        adb.client.update_one(
-            {"_id": author["_id"]},
-            {
-                "$setOnInsert": author,
-                "$set": {
-                    "dblp_publication": [p["ID"] for p in d["publication"] if "ID" in p]
+    with bulk_writer(adb, batch_size) as abw, bulk_writer(pdb, batch_size) as pbw:
+        for d in data:
+            logger.info(f'Importing author [{d["name"]:30}]')
+            # Update author
+            author = {
+                "_id": d["email"],
+                "name": d["name"],
+                "email": d["email"],
+                "dblp": d["dblp"],
+                "google_scholar": d["google_scholar"],
+            }
+            abw.update_one(
+                {"_id": author["_id"]},
+                {
+                    "$setOnInsert": author,
+                    "$set": {
+                        "dblp_publication": [
+                            p["ID"] for p in d["publication"] if "ID" in p
+                        ]
+                    },
                 },
-            },
-            upsert=True,
-        )
-        # Update publications
-        pubs = [p for p in d["publication"] if "ID" in p]
-        for p in pubs:
-            p["_id"] = p.pop("ID")
-            if "editor" in p and "author" not in p:
-                p["author"] = p["editor"]
-            author_list = p["author"].split("\n")
-            p["author"] = []
-            for a in author_list:
-                a = re.sub(r"\s*and\s*", "", a)
-                a = re.sub(r"\s+", " ", a)
-                p["author"].append(a)
-            p["title"] = norm_title(p.pop("title"))
-            pa = {"name": author["name"], "email": author["email"]}
-            pdb.client.update_one(
+                upsert=True,
+            )
+            # Update publications
+            pubs = [p for p in d["publication"] if "ID" in p]
+            for p in pubs:
+                dblp_paper_record(p)
+                pa = {"name": author["name"], "email": author["email"]}
+                pbw.update_one(
+                    {"_id": p["_id"]},
+                    {"$set": p, "$addToSet": {"PCAuthor": pa}},
+                    upsert=True,
+                )
+
+
+@dbimport.command()
+@click.option(
+    "-f",
+    "--dblp_xml_file",
+    required=True,
+    help="dblp.xml.gz dump, with dblp.dtd in the same directory",
+)
+@click.option("-a", "--author_dbcol_name", default="hotcrp:pc")
+@click.option("-p", "--paper_dbcol_name", default="dblp:paper")
+@click.option(
+    "-c",
+    "--pid_cache_file",
+    help="Keep DBLP names of each pid here, default: <dblp_xml_file>.pids.json",
+)
+@click.option(
+    "-b",
+    "--batch_size",
+    type=int,
+    default=1000,
+    help="Number of operations per bulk_write batch",
+)
+def dblp_xml(
+    dblp_xml_file, author_dbcol_name, paper_dbcol_name, pid_cache_file, batch_size
+):
+    """Import PC publications from a local DBLP dump, in the same schema as
+    the dblp command, with no network access."""
+    logger = logging.getLogger()
+    adb = make_mongodb(author_dbcol_name)
+    pdb = make_mongodb(paper_dbcol_name)
+
+    projection = {"name": 1, "first": 1, "last": 1, "email": 1, "dblp": 1}
+    members = list(adb.client.find({}, projection))
+    pids = [dblp_pid(m.get("dblp")) for m in members]
+    pid_names = resolve_pid_names(
+        dblp_xml_file,
+        [pid for pid in pids if pid],
+        pid_cache_file or f"{dblp_xml_file}.pids.json",
+    )
+    matcher = pc_matcher(members, pid_names)
+    logger.info(f"Matching [{len(members)}] PC members, [{len(pid_names)}] by DBLP pid")
+
+    start = time.perf_counter()
+    publications = {m["email"]: [] for m in members}
+    records = matched = 0
+    with bulk_writer(pdb, batch_size) as pbw:
+        for elem in iter_dblp_records(dblp_xml_file):
+            records += 1
+            if records % 1000000 == 0:
+                logger.info(f"    [{records:>9}] records, [{matched:>6}] matched")
+            names = [a.text for a in elem if a.tag in ("author", "editor")]
+            pas = matcher.match([n for n in names if n])
+            if not pas:
+                continue
+            entry = dblp_xml_entry(elem)
+            if "title" not in entry:
+                continue
+            matched += 1
+            p = dblp_paper_record(entry)
+            pbw.update_one(
                 {"_id": p["_id"]},
-                {"$set": p, "$addToSet": {"PCAuthor": pa}},
+                {"$set": p, "$addToSet": {"PCAuthor": {"$each": pas}}},
                 upsert=True,
             )
+            for pa in pas:
+                if p["_id"] not in publications[pa["email"]]:
+                    publications[pa["email"]].append(p["_id"])
+    with bulk_writer(adb, batch_size) as abw:
+        for email, pubs in publications.items():
+            # Keep the publications of members not found in the dump
+            if not pubs:
+                continue
+            abw.update_one({"_id": email}, {"$set": {"dblp_publication": pubs}})
+    logger.info(
+        f"Imported [{matched}] publications out of [{records}] records "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    missing = [email for email, pubs in publications.items() if not pubs]
+    if missing:
+        logger.warning(
+            f"[{len(missing)}] PC members not found in the dump, left unchanged: "
+            f"{missing}"
+        )
 
 
 @dbimport.command()
@@ -198,21 +301,33 @@ def submission(submission_path, submission_dbcol_name, field_to_update):
     help="JSON file of submission info, downloaded from HotCRP.",
 )
 @click.option("-s", "--submission_dbcol_name", default="hotcrp:submission")
-@click.option("-f", "--field_to_update", required=True)
-def submission_info(submission_info_file, submission_dbcol_name, field_to_update):
+@click.option(
+    "-f",
+    "--field_to_update",
+    required=True,
+    multiple=True,
+    help="Can be specified multiple times to update several fields in one pass",
+)
+@click.option("-b", "--batch_size", type=int, default=500)
+def submission_info(
+    submission_info_file, submission_dbcol_name, field_to_update, batch_size
+):
     logger = logging.getLogger()
     sdb = make_mongodb(submission_dbcol_name)
 
-    with open(submission_info_file, "r") as f:
-        sub_info = json.load(f)
-
-    for sub in sub_info:
-        if field_to_update not in sub:
-            raise Exception(f"Field {field_to_update} not found in record {sub}")
-        logger.info(f'Updating paper [{sub["pid"]:>4}], field {field_to_update}')
-        sdb.client.update_one(
-            {"_id": int(sub["pid"])}, {"$set": {field_to_update: sub[field_to_update]}}, upsert=True 
-        )
+    total = 0
+    with bulk_writer(sdb, batch_size) as bw:
+        for sub in iter_json_array(submission_info_file):
+            update = dict()
+            for field in field_to_update:
+                if field not in sub:
+                    raise Exception(f'Field {field} not found in record [{sub["pid"]}]')
+                update[field] = sub[field]
+            bw.update_one({"_id": int(sub["pid"])}, {"$set": update}, upsert=True)
+            total += 1
+            if total % batch_size == 0:
+                logger.info(f"Read [{total:>5}] submissions")
+    logger.info(f"Total updated: {total}, fields {', '.join(field_to_update)}")
 
 
 @dbimport.command()
@@ -242,19 +357,17 @@ def submission_tag(submission_tag_file, submission_dbcol_name):
 @dbimport.command()
 @click.option("-t", "--submission_file", required=True)
 @click.option("-s", "--submission_dbcol_name", default="hotcrp:submission")
-def submission_mark_haspdf(submission_file, submission_dbcol_name):
+@click.option("-b", "--batch_size", type=int, default=500)
+def submission_mark_haspdf(submission_file, submission_dbcol_name, batch_size):
     logger = logging.getLogger()
     db, col = submission_dbcol_name.split(":")
     sdb = mongodb(db, col)
 
-    with open(submission_file, "r", encoding="utf-8") as f:
-        subs = json.load(f)
     total = 0
-    for s in subs:
-        pid = s["pid"]
-        logger.info(f"Updating paper [{pid:>4}]")
-        sdb.client.update_one({"_id": int(pid)}, {"$set": {"haspdf": True}})
-        total += 1
+    with bulk_writer(sdb, batch_size) as bw:
+        for s in iter_json_array(submission_file):
+            bw.update_one({"_id": int(s["pid"])}, {"$set": {"haspdf": True}})
+            total += 1
     logger.info(f"Total updated: {total}")
 
 
@@ -27,7 +27,7 @@ python3 import.py pc-member -f micro2022-pcinfo.csv
 python3 import.py submission-tag -t micro2022-topics.csv -s hotcrp:submission
 
 python3 conflict.py find-chair-conflict-papers -s hotcrp:submission -p hotcrp:pc > chair_conflicts.log
-python3 conflict.py check-author-in-conflict -s hotcrp:submission -m dblp:paper -p hotcrp:pc > author_conflicts.log
+python3 conflict.py check-author-in-conflict -s hotcrp:submission -p hotcrp:pc > author_conflicts.log
 python3 submission.py check-pc-reference -s hotcrp:submission -m dblp:paper -p hotcrp:pc 
 python3 submission.py suggest-reviewers -s hotcrp:submission -m dblp:paper -p hotcrp:pc
 
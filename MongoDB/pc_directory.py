@@ -0,0 +1,76 @@
+import copy
+import logging
+
+
+class pc_directory:
+    """All PC member records, loaded once per command.
+
+    Records are keyed by email, with precomputed:
+      - pc_type: "tpc" or "erc" based on the tags field, "chair" for chairs
+        without such tag, None otherwise;
+      - tag sets, in tag_sets[email];
+      - display names, in names[email].
+    """
+
+    def __init__(self, pdb):
+        self.logger = logging.getLogger("pc_directory")
+        self.records = dict()
+        self.tag_sets = dict()
+        self.names = dict()
+        for r in pdb.client.find():
+            self.add(r)
+        self.logger.info(
+            f"Loaded [{len(self.records)}] pc members "
+            f"from [{pdb.database}:{pdb.collection}]"
+        )
+
+    def add(self, record):
+        email = record["email"]
+        tags = record.get("tags", [])
+        if "tpc" in tags:
+            record["pc_type"] = "tpc"
+        elif "erc" in tags:
+            record["pc_type"] = "erc"
+        elif "chair" in record.get("roles", ""):
+            record["pc_type"] = "chair"
+        else:
+            record["pc_type"] = None
+        self.records[email] = record
+        self.tag_sets[email] = set(tags)
+        if "first" in record and "last" in record:
+            self.names[email] = f'{record["first"]} {record["last"]}'
+        else:
+            self.names[email] = record.get("name", email)
+
+    def __contains__(self, email):
+        return email in self.records
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, email):
+        """Return a copy of the record, safe to modify by the caller."""
+        return copy.deepcopy(self.records[email])
+
+    def pc_type(self, email):
+        return self.records[email]["pc_type"]
+
+    def is_chair(self, email):
+        return "chair" in self.records[email].get("roles", "")
+
+    def by_type(self, pc_type):
+        return [r for r in self.records.values() if r["pc_type"] == pc_type]
+
+    def chairs(self):
+        return [r for r in self.records.values() if self.is_chair(r["email"])]
+
+    def tpc(self):
+        """TPC members and chairs, chairs may not have the 'tpc' tag."""
+        return [
+            r
+            for r in self.records.values()
+            if r["pc_type"] == "tpc" or self.is_chair(r["email"])
+        ]
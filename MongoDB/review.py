@@ -4,10 +4,17 @@ import json
 import logging
 import os
 import re
+import time
 from pathlib import Path
 
 import click
+import numpy as np
 
+from affinity import affinity_matrix
+from assignment import solve_assignment as solve_reviewer_assignment
+from bulk import bulk_writer
+from pc_directory import pc_directory
+from tags import tag_fields
 from utils import make_mongodb
 
 log_format = logging.Formatter(
@@ -40,49 +47,51 @@ def review():
 )
 @click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
 @click.option("-f", "--force", is_flag=True)
+@click.option(
+    "-o",
+    "--out_file",
+    help="Export preferences as a HotCRP upload csv instead of updating MongoDB",
+)
+@click.option("-b", "--batch_size", type=int, default=1000)
 def gen_review_preference(
     submission_id,
     submission_dbcol_name,
     submission_review_pref_dbcol_name,
     pcmember_dbcol_name,
     force,
+    out_file,
+    batch_size,
 ):
     sdb = make_mongodb(submission_dbcol_name)
     rdb = make_mongodb(submission_review_pref_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
+    pcdir = pc_directory(pdb)
 
     if submission_id:
-        gen_review_preference_single(submission_id, sdb, rdb, pdb, force)
+        gen_review_preference_single(submission_id, sdb, rdb, pcdir, force)
     else:
-        ids = sdb.client.find().distinct("_id")
-        for sid in ids:
-            gen_review_preference_single(sid, sdb, rdb, pdb, force)
+        gen_review_preference_all(sdb, rdb, pcdir, out_file, batch_size)
 
 
-def gen_review_preference_single(sid, sdb, rdb, pdb, force=False):
+def gen_review_preference_single(sid, sdb, rdb, pcdir, force=False):
     logger = logging.getLogger()
     logger.info(f"Generating review preference for paper [{sid:>4}]")
 
-    # Get all pc info
-    pc_records = pdb.client.find(projection={"name": True, "email": True, "tags": True})
-    all_pc = dict()
-    for r in pc_records:
-        r["tags"] = set(r["tags"])
-        all_pc[r["email"]] = r
-
     # Get submission info
     submission = sdb.client.find_one({"_id": sid})
     submission["tags"] = set(submission["tags"])
+    pc_conflicts = submission.get("pc_conflicts", {})
 
     # Get preference list of current paper
     prefs = rdb.client.find({"paper": str(sid)})
     for pref in prefs:
-        reviewer = all_pc[pref["email"]]
+        reviewer_tags = pcdir.tag_sets[pref["email"]]
         score = 0
         for st in submission["tags"]:
-            if st in reviewer["tags"]:
+            if st in reviewer_tags:
                 score += 1
-        if pref["conflict"] != "":
+        # Same conflict rules as gen_review_preference_all
+        if pref["conflict"] != "" or pref["email"] in pc_conflicts:
             score = 0
         preference = "1" if score > 0 else ""
         rdb.client.update_one(
@@ -92,5 +101,177 @@ def gen_review_preference_single(sid, sdb, rdb, pdb, force=False):
         )
 
 
+def gen_review_preference_all(sdb, rdb, pcdir, out_file=None, batch_size=1000):
+    """Score every paper x pc member tag overlap with one matrix product."""
+    logger = logging.getLogger()
+    start = time.perf_counter()
+
+    subs = list(sdb.client.find(projection={"tags": True, "pc_conflicts": True}))
+    paper_index = {s["_id"]: i for i, s in enumerate(subs)}
+    pc_emails = [pc["email"] for pc in pcdir]
+    pc_index = {e: j for j, e in enumerate(pc_emails)}
+    all_tags = sorted(set(t for s in subs for t in s.get("tags", [])))
+    tag_index = {t: k for k, t in enumerate(all_tags)}
+
+    paper_tags = np.zeros((len(subs), len(all_tags)), dtype=np.int32)
+    for i, s in enumerate(subs):
+        for t in set(s.get("tags", [])):
+            paper_tags[i, tag_index[t]] = 1
+    pc_tags = np.zeros((len(pc_emails), len(all_tags)), dtype=np.int32)
+    for j, e in enumerate(pc_emails):
+        for t in pcdir.tag_sets[e]:
+            if t in tag_index:
+                pc_tags[j, tag_index[t]] = 1
+    overlap = paper_tags @ pc_tags.T
+    for i, s in enumerate(subs):
+        for e in s.get("pc_conflicts", {}):
+            if e in pc_index:
+                overlap[i, pc_index[e]] = 0
+    logger.info(
+        f"Scored [{len(subs)} x {len(pc_emails)}] paper x pc pairs "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+    rows = []
+    with contextlib.ExitStack() as stack:
+        if not out_file:
+            bw = stack.enter_context(bulk_writer(rdb, batch_size))
+        prefs = rdb.client.find(
+            projection={"paper": True, "email": True, "conflict": True}
+        )
+        for pref in prefs:
+            i = paper_index.get(int(pref["paper"]))
+            j = pc_index.get(pref["email"])
+            if i is None or j is None:
+                continue
+            score = int(overlap[i, j])
+            if pref["conflict"] != "":
+                score = 0
+            preference = "1" if score > 0 else ""
+            if out_file:
+                if preference != "":
+                    rows.append([pref["paper"], "pref", pref["email"], preference])
+            else:
+                bw.update_one(
+                    {"_id": pref["_id"]},
+                    {"$set": {"preference": preference, "preference_score": score}},
+                )
+    if out_file:
+        with open(out_file, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["paper", "action", "email", "preference"])
+            writer.writerows(rows)
+        logger.info(f"Write [{len(rows)}] preferences to {out_file}")
+
+
+@review.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option(
+    "-r",
+    "--submission_review_pref_dbcol_name",
+    required=True,
+    default="hotcrp:review_preference",
+)
+@click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
+@click.option("-o", "--out_file", required=True, help="HotCRP assignment csv")
+@click.option("--tpc_per_paper", type=int, default=3)
+@click.option("--erc_per_paper", type=int, default=1)
+@click.option("--tpc_load", type=int, default=12, help="Max reviews per TPC member")
+@click.option("--erc_load", type=int, default=6, help="Max reviews per ERC member")
+@click.option("--paper_weight", type=float, default=1.0, help="Per cited PC paper")
+@click.option("--cited_weight", type=float, default=0.0, help="Per citation")
+@click.option("--tag_weight", type=float, default=0.5, help="Per overlapping tag")
+@click.option(
+    "--preference_weight", type=float, default=1.0, help="Per preference_score"
+)
+@click.option("--tpc_action", default="primary")
+@click.option("--erc_action", default="secondary")
+def solve_assignment(
+    submission_dbcol_name,
+    submission_review_pref_dbcol_name,
+    pcmember_dbcol_name,
+    out_file,
+    tpc_per_paper,
+    erc_per_paper,
+    tpc_load,
+    erc_load,
+    paper_weight,
+    cited_weight,
+    tag_weight,
+    preference_weight,
+    tpc_action,
+    erc_action,
+):
+    """
+    Compute a review assignment from affinity scores (cited PC papers and tag
+    overlap, see 'submission.py score-reviewers') and review preferences,
+    subject to conflicts, per-member load limits and per-paper quotas. The
+    output csv can be uploaded to HotCRP, and re-imported with
+    'import.py review-assignment'.
+    """
+    logger = logging.getLogger()
+    sdb = make_mongodb(submission_dbcol_name)
+    rdb = make_mongodb(submission_review_pref_dbcol_name)
+    pdb = make_mongodb(pcmember_dbcol_name)
+    pcdir = pc_directory(pdb)
+
+    projection = {
+        "pc_conflicts": True,
+        "tags": True,
+        "reference.pc_paper": True,
+        "reference.count": True,
+        "reference.match_score": True,
+        "reference.mag_record.PCAuthor": True,
+    }
+    am = affinity_matrix(pcdir, ("tpc", "erc"), tag_fields)
+    am.build(sdb.client.find(projection=projection))
+    score = am.scores(paper_weight, cited_weight, tag_weight)
+
+    paper_index = {pid: i for i, pid in enumerate(am.paper_ids)}
+    for pref in rdb.client.find(
+        projection={
+            "paper": True,
+            "email": True,
+            "conflict": True,
+            "preference_score": True,
+        }
+    ):
+        i = paper_index.get(int(pref["paper"]))
+        j = am.pc_index.get(pref["email"])
+        if i is None or j is None:
+            continue
+        if pref.get("conflict", "") != "":
+            score[i, j] = -np.inf
+        elif np.isfinite(score[i, j]):
+            score[i, j] += preference_weight * pref.get("preference_score", 0)
+
+    pc_types = [pcdir.pc_type(e) for e in am.pc_emails]
+    assignment = solve_reviewer_assignment(
+        score,
+        pc_types,
+        {"tpc": tpc_per_paper, "erc": erc_per_paper},
+        {"tpc": tpc_load, "erc": erc_load},
+    )
+
+    actions = {"tpc": tpc_action, "erc": erc_action}
+    rows = []
+    for i, j in assignment:
+        rows.append(
+            {
+                "paper": am.paper_ids[i],
+                "action": actions[pc_types[j]],
+                "email": am.pc_emails[j],
+            }
+        )
+    rows.sort(key=lambda x: (x["paper"], x["action"], x["email"]))
+    with open(out_file, "w") as f:
+        writer = csv.DictWriter(f, fieldnames=["paper", "action", "email"])
+        writer.writeheader()
+        writer.writerows(rows)
+    logger.info(f"Write [{len(rows)}] assignments to {out_file}")
+
+
 if __name__ == "__main__":
     review()
@@ -4,11 +4,13 @@ import json
 import logging
 import os
 import re
+import sys
 from pathlib import Path
 from collections import Counter
 
 import click
 
+from pc_directory import pc_directory
 from utils import make_mongodb
 
 log_format = logging.Formatter(
@@ -28,30 +30,27 @@ def stats():
     pass
 
 
+review_email_map = {
+    "pcmember_new_email@example.com": "pcmember_previous_email@example.com"
+}
+
+
 def review_email_mapping(review_email) -> str:
-    mapping = {
-        "pcmember_new_email@example.com": "pcmember_previous_email@example.com"
-    }
+    mapping = review_email_map
     if review_email in mapping:
         return mapping[review_email]
     else:
         return review_email
 
 
-@stats.command()
-@click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
-)
-@click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
-def reviews_per_pc(submission_dbcol_name, pcmember_dbcol_name):
+def reviews_per_pc_client_side(submission_dbcol_name, pcmember_dbcol_name):
     logger = logging.getLogger()
     sdb = make_mongodb(submission_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
 
     logger.info("Getting all pc member info")
     pcs = dict()
-    all_pc = pdb.client.find()
-    for pc in all_pc:
+    for pc in pc_directory(pdb):
         pid = pc["email"]
         pcs[pid] = {"tags": pc["tags"], "total_reviews": 0}
     logger.info(f"[{len(pcs)}] total pc members found")
@@ -89,11 +88,7 @@ def reviews_per_pc(submission_dbcol_name, pcmember_dbcol_name):
     logger.info(f"    - Avg Reviews: {erc['reviews'] / erc['count']}")
 
 
-@stats.command()
-@click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
-)
-def topics(submission_dbcol_name):
+def topics_client_side(submission_dbcol_name):
     logger = logging.getLogger()
     sdb = make_mongodb(submission_dbcol_name)
     topics = dict()
@@ -117,11 +112,7 @@ def topics(submission_dbcol_name):
         print(f"{n}\t{t['Accepted']}\t{t['Rejected']}")
 
 
-@stats.command()
-@click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
-)
-def authors_per_paper(submission_dbcol_name):
+def authors_per_paper_client_side(submission_dbcol_name):
     logger = logging.getLogger()
     sdb = make_mongodb(submission_dbcol_name)
 
@@ -149,11 +140,7 @@ def authors_per_paper(submission_dbcol_name):
         print(f'{n}\t{a["Accepted"]}\t{a["Rejected"]}')
 
 
-@stats.command()
-@click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
-)
-def papers_per_author(submission_dbcol_name):
+def papers_per_author_client_side(submission_dbcol_name):
     logger = logging.getLogger()
     sdb = make_mongodb(submission_dbcol_name)
 
@@ -187,11 +174,7 @@ def papers_per_author(submission_dbcol_name):
     logger.info(f"Total distince authors: {len(papers)}")
 
 
-@stats.command()
-@click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
-)
-def submission_type(submission_dbcol_name):
+def submission_type_client_side(submission_dbcol_name):
     logger = logging.getLogger()
     sdb = make_mongodb(submission_dbcol_name)
 
@@ -229,12 +212,7 @@ def submission_type(submission_dbcol_name):
     logger.info(f"Accepted: {accepted}")
 
 
-@stats.command()
-@click.option(
-    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
-)
-@click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
-def pc_type_per_paper(submission_dbcol_name, pcmember_dbcol_name):
+def pc_type_per_paper_client_side(submission_dbcol_name, pcmember_dbcol_name):
     logger = logging.getLogger()
     sdb = make_mongodb(submission_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
@@ -242,10 +220,7 @@ def pc_type_per_paper(submission_dbcol_name, pcmember_dbcol_name):
     paper_tpc = Counter()
     paper_erc = Counter()
 
-    all_pcs_raw = pdb.client.find()
-    all_pcs = dict()
-    for pc in all_pcs_raw:
-        all_pcs[pc["_id"]] = pc
+    pcdir = pc_directory(pdb)
 
     for sub in sdb.client.find():
         logger.info(f"Parsing [{sub['_id']:>4}]")
@@ -256,9 +231,9 @@ def pc_type_per_paper(submission_dbcol_name, pcmember_dbcol_name):
         curr_erc = 0
         for reviewer in sub["review_assignment"]:
             remail = review_email_mapping(reviewer)
-            if "tpc" in all_pcs[remail]["tags"]:
+            if pcdir.pc_type(remail) == "tpc":
                 curr_tpc += 1
-            elif "erc" in all_pcs[remail]["tags"]:
+            elif pcdir.pc_type(remail) == "erc":
                 curr_erc += 1
             else:
                 raise Exception(f"Reviewer [{remail}] is neigher TPC nor ERC")
@@ -270,5 +245,366 @@ def pc_type_per_paper(submission_dbcol_name, pcmember_dbcol_name):
     logger.info("ERC summary")
     print(paper_erc)
 
+
+def run_pipeline(db, pipeline):
+    """Run an aggregation pipeline on the server and return the grouped results."""
+    logger = logging.getLogger()
+    logger.debug(f"Running pipeline on [{db.database}:{db.collection}]: {pipeline}")
+    return list(db.client.aggregate(pipeline, allowDiskUse=True))
+
+
+def emit(columns, rows, output_format="tsv"):
+    delimiter = "\t" if output_format == "tsv" else ","
+    writer = csv.writer(sys.stdout, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows(rows)
+
+
+def count_by_decision():
+    """Accumulators counting Accepted and Rejected documents in a $group stage."""
+    return {
+        d: {"$sum": {"$cond": [{"$eq": ["$decision", d]}, 1, 0]}}
+        for d in ["Accepted", "Rejected"]
+    }
+
+
+def review_email_expr(field):
+    """Server-side equivalent of review_email_mapping() applied to field."""
+    mapping = review_email_map
+    return {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": [field, src]}, "then": tgt}
+                for src, tgt in mapping.items()
+            ],
+            "default": field,
+        }
+    }
+
+
+has_decision = {"$match": {"decision": {"$exists": True}}}
+
+
+@stats.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
+@click.option("--client_side", is_flag=True, help="Use the original client-side path")
+@click.option("-o", "--output_format", type=click.Choice(["tsv", "csv"]), default="tsv")
+def reviews_per_pc(
+    submission_dbcol_name, pcmember_dbcol_name, client_side, output_format
+):
+    if client_side:
+        return reviews_per_pc_client_side(submission_dbcol_name, pcmember_dbcol_name)
+    logger = logging.getLogger()
+    sdb = make_mongodb(submission_dbcol_name)
+    pdb = make_mongodb(pcmember_dbcol_name)
+
+    no_review = sdb.client.count_documents({"review_assignment": {"$exists": False}})
+    if no_review > 0:
+        logger.warning(f"[{no_review}] submissions do not have reviewers assigned")
+    reviews = run_pipeline(
+        sdb,
+        [
+            {"$project": {"review_assignment": True}},
+            {"$unwind": "$review_assignment"},
+            {
+                "$group": {
+                    "_id": review_email_expr("$review_assignment"),
+                    "total_reviews": {"$sum": 1},
+                }
+            },
+        ],
+    )
+    reviews = {r["_id"]: r["total_reviews"] for r in reviews}
+
+    summary = {"tpc": [0, 0], "erc": [0, 0]}
+    for pc in pc_directory(pdb):
+        pc_type = pc["pc_type"]
+        if pc_type not in summary:
+            logger.warning(f"PC member is neither TPC nor ERC: [{pc['email']:>20}]")
+            continue
+        summary[pc_type][0] += 1
+        summary[pc_type][1] += reviews.pop(pc["email"], 0)
+    for email in reviews:
+        logger.warning(f"Reviewer is not a PC member: [{email:>20}]")
+    emit(
+        ["type", "count", "reviews", "avg_reviews"],
+        [[t, c, r, r / c if c > 0 else 0] for t, (c, r) in summary.items()],
+        output_format,
+    )
+
+
+@stats.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option("--client_side", is_flag=True, help="Use the original client-side path")
+@click.option("-o", "--output_format", type=click.Choice(["tsv", "csv"]), default="tsv")
+def topics(submission_dbcol_name, client_side, output_format):
+    if client_side:
+        return topics_client_side(submission_dbcol_name)
+    logger = logging.getLogger()
+    sdb = make_mongodb(submission_dbcol_name)
+    res = run_pipeline(
+        sdb,
+        [
+            has_decision,
+            {"$project": {"topics": True, "decision": True}},
+            {"$unwind": "$topics"},
+            {"$group": {"_id": "$topics", **count_by_decision()}},
+            {"$sort": {"_id": 1}},
+        ],
+    )
+    logger.info(f"Total topics: {len(res)}")
+    emit(
+        ["topic", "accepted", "rejected"],
+        [[r["_id"].replace(",", ""), r["Accepted"], r["Rejected"]] for r in res],
+        output_format,
+    )
+
+
+@stats.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option("--client_side", is_flag=True, help="Use the original client-side path")
+@click.option("-o", "--output_format", type=click.Choice(["tsv", "csv"]), default="tsv")
+def authors_per_paper(submission_dbcol_name, client_side, output_format):
+    if client_side:
+        return authors_per_paper_client_side(submission_dbcol_name)
+    logger = logging.getLogger()
+    sdb = make_mongodb(submission_dbcol_name)
+    res = run_pipeline(
+        sdb,
+        [
+            has_decision,
+            {
+                "$project": {
+                    "decision": True,
+                    "num_authors": {"$size": {"$ifNull": ["$authors", []]}},
+                }
+            },
+            {"$group": {"_id": "$num_authors", **count_by_decision()}},
+            {"$sort": {"_id": 1}},
+        ],
+    )
+    total_paper = sum(r["Accepted"] + r["Rejected"] for r in res)
+    total_author = sum(r["_id"] * (r["Accepted"] + r["Rejected"]) for r in res)
+    if total_paper > 0:
+        logger.info(
+            f"Avg authors per paper: {total_author} / {total_paper} = {total_author / total_paper}"
+        )
+    emit(
+        ["authors_per_paper", "accepted", "rejected"],
+        [[r["_id"], r["Accepted"], r["Rejected"]] for r in res],
+        output_format,
+    )
+
+
+@stats.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option("--client_side", is_flag=True, help="Use the original client-side path")
+@click.option("-o", "--output_format", type=click.Choice(["tsv", "csv"]), default="tsv")
+def papers_per_author(submission_dbcol_name, client_side, output_format):
+    if client_side:
+        return papers_per_author_client_side(submission_dbcol_name)
+    logger = logging.getLogger()
+    sdb = make_mongodb(submission_dbcol_name)
+    res = run_pipeline(
+        sdb,
+        [
+            has_decision,
+            {
+                "$project": {
+                    "authors.first": True,
+                    "authors.last": True,
+                    "decision": True,
+                }
+            },
+            {"$unwind": "$authors"},
+            {"$match": {"authors.first": {"$exists": True}}},
+            {
+                "$group": {
+                    "_id": {"$concat": ["$authors.first", " ", "$authors.last"]},
+                    **count_by_decision(),
+                }
+            },
+            {
+                "$group": {
+                    "_id": {"$add": ["$Accepted", "$Rejected"]},
+                    "Accepted": {"$sum": "$Accepted"},
+                    "Rejected": {"$sum": "$Rejected"},
+                    "Occurance": {"$sum": 1},
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ],
+    )
+    logger.info(f"Total distince authors: {sum(r['Occurance'] for r in res)}")
+    emit(
+        ["papers_per_author", "accepted", "rejected", "occurance"],
+        [[r["_id"], r["Accepted"], r["Rejected"], r["Occurance"]] for r in res],
+        output_format,
+    )
+
+
+@stats.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option("--client_side", is_flag=True, help="Use the original client-side path")
+@click.option("-o", "--output_format", type=click.Choice(["tsv", "csv"]), default="tsv")
+def submission_type(submission_dbcol_name, client_side, output_format):
+    if client_side:
+        return submission_type_client_side(submission_dbcol_name)
+    sdb = make_mongodb(submission_dbcol_name)
+
+    def exists(field):
+        return {"$ne": [{"$type": field}, "missing"]}
+
+    res = run_pipeline(
+        sdb,
+        [
+            has_decision,
+            {
+                "$project": {
+                    "decision": True,
+                    "resubmission": {
+                        "$cond": [
+                            exists("$revisionlettersharingoptions"),
+                            {
+                                "$ne": [
+                                    "$revisionlettersharingoptions",
+                                    "First submission",
+                                ]
+                            },
+                            exists("$resubmission"),
+                        ]
+                    },
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$resubmission",
+                    "total": {"$sum": 1},
+                    "accepted": {
+                        "$sum": {"$cond": [{"$eq": ["$decision", "Accepted"]}, 1, 0]}
+                    },
+                }
+            },
+            {"$sort": {"_id": 1}},
+        ],
+    )
+    emit(
+        ["type", "total", "accepted"],
+        [
+            [
+                "Resubmission" if r["_id"] else "First submission",
+                r["total"],
+                r["accepted"],
+            ]
+            for r in res
+        ],
+        output_format,
+    )
+
+
+@stats.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
+@click.option("--client_side", is_flag=True, help="Use the original client-side path")
+@click.option("-o", "--output_format", type=click.Choice(["tsv", "csv"]), default="tsv")
+def pc_type_per_paper(
+    submission_dbcol_name, pcmember_dbcol_name, client_side, output_format
+):
+    if client_side:
+        return pc_type_per_paper_client_side(submission_dbcol_name, pcmember_dbcol_name)
+    sdb = make_mongodb(submission_dbcol_name)
+    pdb = make_mongodb(pcmember_dbcol_name)
+    if sdb.database != pdb.database:
+        raise Exception(
+            "$lookup requires submissions and pc members in the same database, "
+            "use --client_side instead"
+        )
+
+    def has_tag(tag):
+        return {"$in": [tag, {"$ifNull": ["$pc.tags", []]}]}
+
+    # Papers without reviewers and reviewers missing from the PC collection
+    # are kept, the former count in the 0 buckets, the latter as "other"
+    res = run_pipeline(
+        sdb,
+        [
+            has_decision,
+            {"$project": {"review_assignment": True}},
+            {
+                "$unwind": {
+                    "path": "$review_assignment",
+                    "preserveNullAndEmptyArrays": True,
+                }
+            },
+            {"$project": {"email": review_email_expr("$review_assignment")}},
+            {
+                "$lookup": {
+                    "from": pdb.collection,
+                    "localField": "email",
+                    "foreignField": "_id",
+                    "as": "pc",
+                }
+            },
+            {"$unwind": {"path": "$pc", "preserveNullAndEmptyArrays": True}},
+            {"$project": {"email": True, "pc.tags": True}},
+            {
+                "$group": {
+                    "_id": "$_id",
+                    "tpc": {"$sum": {"$cond": [has_tag("tpc"), 1, 0]}},
+                    "erc": {
+                        "$sum": {
+                            "$cond": [
+                                {"$and": [{"$not": [has_tag("tpc")]}, has_tag("erc")]},
+                                1,
+                                0,
+                            ]
+                        }
+                    },
+                    "reviews": {
+                        "$sum": {"$cond": [{"$ifNull": ["$email", False]}, 1, 0]}
+                    },
+                }
+            },
+            {
+                "$facet": {
+                    "tpc": [{"$group": {"_id": "$tpc", "papers": {"$sum": 1}}}],
+                    "erc": [{"$group": {"_id": "$erc", "papers": {"$sum": 1}}}],
+                    "other": [
+                        {
+                            "$match": {
+                                "$expr": {
+                                    "$ne": [{"$add": ["$tpc", "$erc"]}, "$reviews"]
+                                }
+                            }
+                        }
+                    ],
+                }
+            },
+        ],
+    )[0]
+    if len(res["other"]) > 0:
+        raise Exception(
+            f"Papers with reviewers neither TPC nor ERC: {[r['_id'] for r in res['other']]}"
+        )
+    rows = []
+    for pc_type in ["tpc", "erc"]:
+        for r in sorted(res[pc_type], key=lambda x: x["_id"]):
+            rows.append([pc_type, r["_id"], r["papers"]])
+    emit(["type", "reviewers_per_paper", "papers"], rows, output_format)
+
+
 if __name__ == "__main__":
     stats()
@@ -0,0 +1,13 @@
+import ijson
+
+
+def iter_json_array(json_file, prefix="item"):
+    """Yield the elements of a top-level JSON array one by one.
+
+    The file is parsed incrementally, so memory stays bounded by the size of a
+    single element instead of the whole export.
+    """
+    with open(json_file, "rb") as f:
+        # use_float: pymongo cannot encode the Decimal ijson returns by default
+        for item in ijson.items(f, prefix, use_float=True):
+            yield item
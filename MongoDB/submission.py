@@ -3,11 +3,16 @@ import csv
 import json
 import logging
 import os
-import re
+import time
 from pathlib import Path
 
 import click
 
+from affinity import affinity_matrix
+from bulk import bulk_writer
+from pc_directory import pc_directory
+from tags import tag_fields
+from title_index import make_title_index
 from utils import make_mongodb
 
 log_format = logging.Formatter(
@@ -35,19 +40,45 @@ def submission():
 @click.option("-m", "--mag_dbcol_name", required=True, default="mag:paper")
 @click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
 @click.option("-f", "--force", is_flag=True)
+@click.option(
+    "-x",
+    "--index_file",
+    help="Persist the title index of the PC publication collection to this file "
+    "and reuse it in later runs",
+)
+@click.option("--rebuild_index", is_flag=True)
+@click.option(
+    "-t",
+    "--fuzzy_threshold",
+    type=float,
+    default=0.85,
+    help="Minimum trigram similarity to accept an approximate title match",
+)
+@click.option("--exact", is_flag=True, help="Only accept exact title matches")
 def check_pc_reference(
-    submission_id, submission_dbcol_name, mag_dbcol_name, pcmember_dbcol_name, force
+    submission_id,
+    submission_dbcol_name,
+    mag_dbcol_name,
+    pcmember_dbcol_name,
+    force,
+    index_file,
+    rebuild_index,
+    fuzzy_threshold,
+    exact,
 ):
     sdb = make_mongodb(submission_dbcol_name)
     mdb = make_mongodb(mag_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
+    tindex = make_title_index(mdb, index_file, rebuild_index)
+    threshold = None if exact else fuzzy_threshold
 
     if submission_id:
-        check_pc_reference_single(submission_id, sdb, mdb, pdb, force)
+        check_pc_reference_single(submission_id, sdb, tindex, pdb, force, threshold)
     else:
-        ids = sdb.client.find().distinct("_id")
-        for sid in ids:
-            check_pc_reference_single(sid, sdb, mdb, pdb, force)
+        for sub in sdb.client.find(projection={"reference": True}):
+            check_pc_reference_single(
+                sub["_id"], sdb, tindex, pdb, force, threshold, sub
+            )
 
 
 @submission.command()
@@ -64,13 +95,14 @@ def aggregate_tags(
     sdb = make_mongodb(submission_dbcol_name)
     mdb = make_mongodb(mag_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
+    pcdir = pc_directory(pdb)
 
     if submission_id:
-        aggregate_tags_single(submission_id, sdb, mdb, pdb, force)
+        aggregate_tags_single(submission_id, sdb, mdb, pcdir, force)
     else:
         ids = sdb.client.find().distinct("_id")
         for sid in ids:
-            aggregate_tags_single(sid, sdb, mdb, pdb, force)
+            aggregate_tags_single(sid, sdb, mdb, pcdir, force)
 
 
 @submission.command()
@@ -81,84 +113,223 @@ def aggregate_tags(
 @click.option("-m", "--mag_dbcol_name", required=True, default="mag:paper")
 @click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
 @click.option("-f", "--force", is_flag=True)
+@click.option(
+    "-b",
+    "--batch_size",
+    type=int,
+    default=100,
+    help="Number of papers per bulk write when processing all papers",
+)
 def suggest_reviewers(
-    submission_id, submission_dbcol_name, mag_dbcol_name, pcmember_dbcol_name, force
+    submission_id,
+    submission_dbcol_name,
+    mag_dbcol_name,
+    pcmember_dbcol_name,
+    force,
+    batch_size,
 ):
     sdb = make_mongodb(submission_dbcol_name)
     mdb = make_mongodb(mag_dbcol_name)
     pdb = make_mongodb(pcmember_dbcol_name)
+    pcdir = pc_directory(pdb)
 
     if submission_id:
-        suggest_reviewers_single(submission_id, sdb, mdb, pdb, force)
+        suggest_reviewers_single(submission_id, sdb, mdb, pcdir, force)
     else:
-        ids = sdb.client.find().distinct("_id")
-        for sid in ids:
-            suggest_reviewers_single(sid, sdb, mdb, pdb, force)
-
-
-def suggest_reviewers_single(sid, sdb, mdb, pdb, force=False):
+        suggest_reviewers_all(sdb, pcdir, batch_size)
+
+
+# Only the fields needed to suggest reviewers, the full reference records are large
+suggest_reviewers_projection = {
+    "pc_conflicts": True,
+    "reference.pc_paper": True,
+    "reference.count": True,
+    "reference.match_score": True,
+    "reference.mag_record.PCAuthor": True,
+}
+# With the results of the previous run, only the fields that changed are written
+suggest_reviewers_update_projection = {
+    **suggest_reviewers_projection,
+    "reference.pc_paper_no_conflict": True,
+    "reference.tpc_no_conflict": True,
+    "reference.erc_no_conflict": True,
+}
+
+
+def suggest_reviewers_update(sub, pcdir):
+    """Compute potential reviewers of a submission.
+
+    Return the update document: $set of the potential reviewers and of the
+    per-reference fields that changed, addressed by their index in the
+    reference list, and $unset of the reviewer lists of references no longer
+    matched to a PC paper.
+    """
     logger = logging.getLogger()
-    logger.info(f"Suggesting reviewers for paper [{sid:>4}]")
-    sub = sdb.client.find_one({"_id": sid})
-    assert sub is not None
-    if "reference" not in sub:
-        logger.warning(
-            f"Paper [{sid:>4}] does not have reference extraced from pdf: {sub.keys()}"
-        )
-        return
-
     sub_conflict = sub["pc_conflicts"]
     pc_no_conflict = dict()
+    set_fields = dict()
+    unset_fields = dict()
 
     def get_pc(pemail):
         if pemail not in pc_no_conflict:
-            precord = pdb.client.find_one({"_id": pemail})
-            if "tpc" in precord["tags"]:
-                precord["pc_type"] = "tpc"
-            elif "erc" in precord["tags"]:
-                precord["pc_type"] = "erc"
-            else:
+            precord = pcdir.get(pemail)
+            if precord["pc_type"] not in ["tpc", "erc"]:
                 logger.warning(
                     f'Skip this pc member who is neither tpc nor erc, based on the tags field: {precord["first"]} {precord["last"]}'
                 )
                 precord["pc_type"] = None
             precord["count_paper"] = 0
             precord["count_cited"] = 0
+            precord["count_cited_weighted"] = 0
             pc_no_conflict[pemail] = precord
         return pc_no_conflict[pemail]
 
-    for ref in sub["reference"]:
-        ref["pc_paper_no_conflict"] = False
+    for i, ref in enumerate(sub["reference"]):
+        no_conflict = False
         if ref["pc_paper"]:
-            ref["tpc_no_conflict"] = []
-            ref["erc_no_conflict"] = []
+            reviewers = {"tpc_no_conflict": [], "erc_no_conflict": []}
             for p in ref["mag_record"]["PCAuthor"]:
                 if p["email"] not in sub_conflict:
-                    ref["pc_paper_no_conflict"] = True
+                    no_conflict = True
                     pc = get_pc(p["email"])
                     pc["count_paper"] += 1
                     pc["count_cited"] += ref["count"]
+                    # Approximate title matches count proportionally to their score
+                    pc["count_cited_weighted"] += ref["count"] * ref.get(
+                        "match_score", 1.0
+                    )
                     if pc["pc_type"] == "tpc":
-                        ref["tpc_no_conflict"].append(p)
+                        reviewers["tpc_no_conflict"].append(p)
                     elif pc["pc_type"] == "erc":
-                        ref["erc_no_conflict"].append(p)
+                        reviewers["erc_no_conflict"].append(p)
+            for field, value in reviewers.items():
+                if ref.get(field) != value:
+                    set_fields[f"reference.{i}.{field}"] = value
+        else:
+            for field in ["tpc_no_conflict", "erc_no_conflict"]:
+                if field in ref:
+                    unset_fields[f"reference.{i}.{field}"] = ""
+        if ref.get("pc_paper_no_conflict") != no_conflict:
+            set_fields[f"reference.{i}.pc_paper_no_conflict"] = no_conflict
 
     suggested_reviewers = [p for _, p in pc_no_conflict.items()]
     suggested_reviewers.sort(key=lambda x: x["first"])
+    set_fields["potential_reviewers"] = suggested_reviewers
+    update = {"$set": set_fields}
+    if unset_fields:
+        update["$unset"] = unset_fields
+    return update
+
+
+def suggest_reviewers_single(sid, sdb, mdb, pcdir, force=False):
+    logger = logging.getLogger()
+    logger.info(f"Suggesting reviewers for paper [{sid:>4}]")
+    sub = sdb.client.find_one({"_id": sid}, suggest_reviewers_update_projection)
+    assert sub is not None
+    if "reference" not in sub:
+        logger.warning(
+            f"Paper [{sid:>4}] does not have reference extraced from pdf: {sub.keys()}"
+        )
+        return
 
-    sdb.client.update_one(
-        {"_id": sid},
-        {
-            "$set": {
-                "reference": sub["reference"],
-                "potential_reviewers": suggested_reviewers,
-            }
-        },
-        upsert=True,
-    )
+    update = suggest_reviewers_update(sub, pcdir)
+    sdb.client.update_one({"_id": sid}, update, upsert=True)
 
 
-def aggregate_tags_single(sid, sdb, mdb, pdb, force=False):
+def suggest_reviewers_all(sdb, pcdir, batch_size=100):
+    """Suggest reviewers for all submissions in one streaming pass."""
+    logger = logging.getLogger()
+    missing = sdb.client.find(
+        {"reference": {"$exists": False}}, projection={"_id": True}
+    ).distinct("_id")
+    for sid in missing:
+        logger.warning(f"Paper [{sid:>4}] does not have reference extraced from pdf")
+
+    total = 0
+    with bulk_writer(sdb, batch_size) as bw:
+        for sub in sdb.client.find(
+            {"reference": {"$exists": True}}, suggest_reviewers_update_projection
+        ):
+            update = suggest_reviewers_update(sub, pcdir)
+            bw.update_one({"_id": sub["_id"]}, update)
+            total += 1
+    logger.info(f"Suggested reviewers for [{total}] papers")
+
+
+@submission.command()
+@click.option(
+    "-s", "--submission_dbcol_name", required=True, default="hotcrp:submission"
+)
+@click.option("-p", "--pcmember_dbcol_name", required=True, default="hotcrp:pc")
+@click.option("-k", "--top_k", type=int, default=10)
+@click.option("--paper_weight", type=float, default=1.0, help="Per cited PC paper")
+@click.option(
+    "--cited_weight",
+    type=float,
+    default=0.0,
+    help="Per citation of a PC paper, weighted by the title match score",
+)
+@click.option("--tag_weight", type=float, default=0.0, help="Per overlapping tag")
+@click.option(
+    "-t",
+    "--pc_type",
+    multiple=True,
+    type=click.Choice(["tpc", "erc"]),
+    default=["tpc", "erc"],
+)
+@click.option("-o", "--out_file", help="Output top-k reviewers as csv")
+@click.option(
+    "-w", "--write_back", is_flag=True, help="Store top-k as 'affinity_reviewers'"
+)
+def score_reviewers(
+    submission_dbcol_name,
+    pcmember_dbcol_name,
+    top_k,
+    paper_weight,
+    cited_weight,
+    tag_weight,
+    pc_type,
+    out_file,
+    write_back,
+):
+    """Score all papers x pc members at once with a sparse affinity matrix"""
+    logger = logging.getLogger()
+    sdb = make_mongodb(submission_dbcol_name)
+    pdb = make_mongodb(pcmember_dbcol_name)
+    pcdir = pc_directory(pdb)
+
+    projection = dict(suggest_reviewers_projection)
+    projection["tags"] = True
+    am = affinity_matrix(pcdir, pc_type, tag_fields)
+    am.build(sdb.client.find(projection=projection))
+
+    start = time.perf_counter()
+    best = am.top_k(am.scores(paper_weight, cited_weight, tag_weight), top_k)
+    logger.info(f"Scored all papers in {time.perf_counter() - start:.3f}s")
+
+    if out_file:
+        with open(out_file, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["paper", "rank", "email", "score"])
+            for pid, reviewers in best.items():
+                for rank, (email, score) in enumerate(reviewers):
+                    writer.writerow([pid, rank + 1, email, score])
+    if write_back:
+        with bulk_writer(sdb) as bw:
+            for pid, reviewers in best.items():
+                bw.update_one(
+                    {"_id": pid},
+                    {
+                        "$set": {
+                            "affinity_reviewers": [
+                                {"email": e, "score": s} for e, s in reviewers
+                            ]
+                        }
+                    },
+                )
+
+
+def aggregate_tags_single(sid, sdb, mdb, pcdir, force=False):
     logger = logging.getLogger()
     logger.info(f"Aggregating tags for paper [{sid:>4}]")
     sub = sdb.client.find_one({"_id": sid})
@@ -189,8 +360,8 @@ def aggregate_tags_single(sid, sdb, mdb, pdb, force=False):
                 all_pc_author.add(p["last"])
 
     for pe in all_pc_email_cited:
-        precord = pdb.client.find_one({"_id": pe})
-        for pt in precord["tags"]:
+        precord = pcdir.records[pe]
+        for pt in pcdir.tag_sets[pe]:
             if pt in tag_check:
                 tag_check[pt]["declared_by_pc_member"] = True
                 tag_check[pt]["pc_member"].add(precord["first"])
@@ -209,10 +380,13 @@ def aggregate_tags_single(sid, sdb, mdb, pdb, force=False):
     sdb.client.update_one({"_id": sid}, {"$set": {"tag_check": tag_upload}},upsert=True)
 
 
-def check_pc_reference_single(sid, sdb, mdb, pdb, force=False):
+def check_pc_reference_single(
+    sid, sdb, tindex, pdb, force=False, fuzzy_threshold=None, sub=None
+):
     logger = logging.getLogger()
     logger.info(f"Checking paper [{sid:>4}]")
-    sub = sdb.client.find_one({"_id": sid})
+    if sub is None:
+        sub = sdb.client.find_one({"_id": sid})
     assert sub is not None
     if "reference" not in sub:
         logger.warning(
@@ -229,12 +403,21 @@ def check_pc_reference_single(sid, sdb, mdb, pdb, force=False):
             logger.info(f"Paper [{sid:>4}] already parsed, skip")
             return
         ref["pc_paper"] = False
-        title = norm_title(ref["title"][0])
-        match = mdb.client.find_one({"title": title})
+        if fuzzy_threshold is None:
+            match = tindex.match(ref["title"][0])
+            score, method = 1.0, "exact"
+        else:
+            match, score, method = tindex.fuzzy_match(ref["title"][0], fuzzy_threshold)
         if match:
             ref["pc_paper"] = True
             ref["mag_record"] = match
+            ref["match_score"] = score
+            ref["match_method"] = method
             total_pc_ref += 1
+        else:
+            # Drop the match of a previous run, e.g. with a lower threshold
+            for field in ["mag_record", "match_score", "match_method"]:
+                ref.pop(field, None)
 
     logger.info(f"Paper [{sid:>4}] has cited [{total_pc_ref:>3}] PC papers")
     logger.debug(f"PC paper references:")
@@ -243,6 +426,9 @@ def check_pc_reference_single(sid, sdb, mdb, pdb, force=False):
             logger.debug(f'  - Title : {ref["title"][0]}')
             logger.debug(f'    MAG ID: {ref["mag_record"]["_id"]}')
             logger.debug(f'    MAG Ti: {ref["mag_record"]["title"]}')
+            logger.debug(
+                f'    Match : {ref.get("match_method")} ({ref.get("match_score", 1.0):.2f})'
+            )
             logger.debug(f"    PC    :")
             for pc in ref["mag_record"]["PCAuthor"]:
                 logger.debug(f'    - {pc["first"]} {pc["last"]}')
@@ -250,53 +436,5 @@ def check_pc_reference_single(sid, sdb, mdb, pdb, force=False):
     sdb.client.update_one({"_id": sid}, {"$set": {"reference": sub["reference"]}},upsert=True)
 
 
-tag_fields = [
-    "Accel-Cloud",
-    "Accel-DB_TP",
-    "Accel-Graph",
-    "Accel-Health",
-    "Accel-ML",
-    "Accel-Sci",
-    "AprxCmp",
-    "Embed",
-    "FPGA",
-    "GPGPU",
-    "Integration",
-    "InMemCmp",
-    "Network",
-    "Neuro",
-    "Quantum",
-    "Reliability",
-    "Security",
-    "Traditional",
-    "VLSI",
-    "CacheTLB",
-    "DRAM",
-    "Disk",
-    "NVM",
-    "ArchPL",
-    "CGO",
-    "PLuArch",
-    "RealSys",
-    "PerfModel",
-    "WorkCharac",
-    "VM",
-    "Virt",
-    "ILP",
-    "LowPower",
-    "Parallelism",
-    "CacheSec",
-    "MemSec",
-]
-
-
-def norm_title(title):
-    t = title
-    t = t.lower()
-    t = re.sub(r"\W", " ", t)
-    t = re.sub(r"\s+", " ", t)
-    return t
-
-
 if __name__ == "__main__":
     submission()
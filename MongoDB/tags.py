@@ -0,0 +1,39 @@
+# Paper topic tags, shared by submission tags and pc member tags
+tag_fields = [
+    "Accel-Cloud",
+    "Accel-DB_TP",
+    "Accel-Graph",
+    "Accel-Health",
+    "Accel-ML",
+    "Accel-Sci",
+    "AprxCmp",
+    "Embed",
+    "FPGA",
+    "GPGPU",
+    "Integration",
+    "InMemCmp",
+    "Network",
+    "Neuro",
+    "Quantum",
+    "Reliability",
+    "Security",
+    "Traditional",
+    "VLSI",
+    "CacheTLB",
+    "DRAM",
+    "Disk",
+    "NVM",
+    "ArchPL",
+    "CGO",
+    "PLuArch",
+    "RealSys",
+    "PerfModel",
+    "WorkCharac",
+    "VM",
+    "Virt",
+    "ILP",
+    "LowPower",
+    "Parallelism",
+    "CacheSec",
+    "MemSec",
+]
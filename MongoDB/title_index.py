@@ -0,0 +1,153 @@
+import logging
+import pickle
+import re
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+
+def norm_title(title):
+    t = title
+    t = t.lower()
+    t = re.sub(r"\W", " ", t)
+    t = re.sub(r"\s+", " ", t)
+    return t
+
+
+def trigrams(title):
+    t = f" {title.strip()} "
+    return set(t[i : i + 3] for i in range(len(t) - 2))
+
+
+def trigram_similarity(query, candidate, min_overlap_len=20, min_length_ratio=0.5):
+    """Similarity of two normalized titles in [0, 1], based on character trigrams.
+
+    This is the Dice coefficient of the two trigram sets. If both titles are
+    long enough, and the shorter one has at least min_length_ratio of the
+    trigrams of the longer one, the overlap coefficient (discounted by 10%) is
+    also considered, so that truncated titles or titles missing a subtitle can
+    still match, but a short generic title contained in a much longer one
+    does not.
+    """
+    q = trigrams(query)
+    c = trigrams(candidate)
+    if len(q) == 0 or len(c) == 0:
+        return 0.0
+    common = len(q & c)
+    score = 2 * common / (len(q) + len(c))
+    shorter, longer = sorted([len(q), len(c)])
+    if shorter >= min_overlap_len and shorter >= min_length_ratio * longer:
+        score = max(score, 0.9 * common / shorter)
+    return score
+
+
+class title_index:
+    """In-memory hash index from normalized title to publication record.
+
+    Built with a single scan over a publication collection (e.g. dblp:paper or
+    mag:paper), so matching references never needs a round trip to MongoDB.
+    """
+
+    def __init__(self, records=None, max_query_tokens=4, max_candidates=5):
+        self.logger = logging.getLogger("title_index")
+        self.titles = dict()
+        self.max_query_tokens = max_query_tokens
+        self.max_candidates = max_candidates
+        # Token postings for approximate matching, built on first use
+        self.keys = None
+        self.postings = None
+        if records:
+            for r in records:
+                self.add(r)
+
+    def add(self, record):
+        if "title" not in record or not record["title"]:
+            return
+        self.titles[norm_title(record["title"])] = record
+        self.keys = self.postings = None
+
+    def match(self, title):
+        return self.titles.get(norm_title(title))
+
+    def build_postings(self):
+        start = time.perf_counter()
+        self.keys = list(self.titles.keys())
+        self.postings = defaultdict(list)
+        for i, k in enumerate(self.keys):
+            for tok in set(k.split(" ")):
+                if len(tok) > 2:
+                    self.postings[tok].append(i)
+        self.logger.info(
+            f"Built [{len(self.postings):>6}] token postings "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+    def fuzzy_match(self, title, threshold=0.85):
+        """Return (record, score, method) of the best match, or (None, 0, None).
+
+        An exact hit on the normalized title has score 1.0 and method "exact".
+        Otherwise, candidates sharing the rarest words of the query are ranked
+        by how many of those words they share, and the top few are verified
+        with trigram_similarity (method "trigram").
+        """
+        t = norm_title(title)
+        if t in self.titles:
+            return self.titles[t], 1.0, "exact"
+        if self.postings is None:
+            self.build_postings()
+        tokens = set(tok for tok in t.split(" ") if len(tok) > 2)
+        tokens = [tok for tok in tokens if tok in self.postings]
+        if len(tokens) == 0:
+            return None, 0.0, None
+        tokens.sort(key=lambda tok: len(self.postings[tok]))
+        votes = Counter()
+        for tok in tokens[: self.max_query_tokens]:
+            weight = 1.0 / len(self.postings[tok])
+            for i in self.postings[tok]:
+                votes[i] += weight
+        best, best_score = None, 0.0
+        for i, _ in votes.most_common(self.max_candidates):
+            score = trigram_similarity(t, self.keys[i])
+            if score > best_score:
+                best, best_score = self.keys[i], score
+        if best is None or best_score < threshold:
+            return None, best_score, None
+        return self.titles[best], best_score, "trigram"
+
+    def __len__(self):
+        return len(self.titles)
+
+    @classmethod
+    def from_collection(cls, mdb):
+        start = time.perf_counter()
+        index = cls(mdb.client.find())
+        index.logger.info(
+            f"Indexed [{len(index):>6}] titles from [{mdb.database}:{mdb.collection}] "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return index
+
+    @classmethod
+    def load(cls, index_file):
+        index = cls()
+        with open(index_file, "rb") as f:
+            index.titles = pickle.load(f)
+        index.logger.info(f"Loaded [{len(index):>6}] titles from {index_file}")
+        return index
+
+    def save(self, index_file):
+        tmp_file = Path(f"{index_file}.tmp")
+        with open(tmp_file, "wb") as f:
+            pickle.dump(self.titles, f)
+        tmp_file.replace(index_file)
+        self.logger.info(f"Saved [{len(self):>6}] titles to {index_file}")
+
+
+def make_title_index(mdb, index_file=None, rebuild=False):
+    """Load the title index from index_file if present, otherwise scan mdb once."""
+    if index_file and Path(index_file).exists() and not rebuild:
+        return title_index.load(index_file)
+    index = title_index.from_collection(mdb)
+    if index_file:
+        index.save(index_file)
+    return index
@@ -1,5 +1,65 @@
-from pymongo import MongoClient
+import atexit
 import logging
+import os
+
+from pymongo import MongoClient
+
+# One pooled MongoClient per URI, shared by every collection in this process
+_clients = dict()
+_checked = set()
+
+
+def mongodb_uri():
+    """Build the MongoDB connection URI from environment variables.
+
+    MIGHTYPC_MONGODB_URI takes precedence, otherwise the URI is assembled from
+    MIGHTYPC_MONGODB_USERNAME, MIGHTYPC_MONGODB_PASSWORD and MIGHTYPC_MONGODB_URL.
+    """
+    uri = os.environ.get("MIGHTYPC_MONGODB_URI")
+    if uri:
+        return uri
+    # NOTE: set these environment variables to your MongoDB username, password and url
+    #       if you are using Docker/mighty-pc.yaml to create MongoDB Docker
+    #       you can find and set the default username and password in that file
+    username = os.environ.get("MIGHTYPC_MONGODB_USERNAME", "your_mongodb_username")
+    password = os.environ.get("MIGHTYPC_MONGODB_PASSWORD", "your_mongodb_password")
+    url = os.environ.get("MIGHTYPC_MONGODB_URL", "your_mongodb_url:your_port")
+    return f"mongodb://{username}:{password}@{url}"
+
+
+def get_client(uri=None, ping=False):
+    """Return the shared MongoClient for uri, creating it on first use.
+
+    The client connects lazily. With ping, the server is checked right away,
+    once per uri, so a wrong uri or wrong credentials fail at startup.
+    """
+    logger = logging.getLogger("mongo")
+    if uri is None:
+        uri = mongodb_uri()
+    if uri not in _clients:
+        _clients[uri] = MongoClient(
+            uri,
+            connect=False,
+            maxPoolSize=int(os.environ.get("MIGHTYPC_MONGODB_MAX_POOL_SIZE", 10)),
+            serverSelectionTimeoutMS=int(
+                os.environ.get("MIGHTYPC_MONGODB_TIMEOUT_MS", 2000)
+            ),
+        )
+    if ping and uri not in _checked:
+        _clients[uri].server_info()
+        _checked.add(uri)
+        logger.debug("Connected to MongoDB server")
+    return _clients[uri]
+
+
+def close_clients():
+    for client in _clients.values():
+        client.close()
+    _clients.clear()
+    _checked.clear()
+
+
+atexit.register(close_clients)
 
 
 def make_mongodb(dbcol: str):
@@ -8,19 +68,9 @@ def make_mongodb(dbcol: str):
 
 
 class mongodb:
-    def __init__(self, database, collection):
+    def __init__(self, database, collection, uri=None):
         self.logger = logging.getLogger("mongo")
-        # NOTE: fill with your MongoDB username, password and url
-        #       if you are using Docker/mighty-pc.yaml to create MongoDB Docker
-        #       you can find and set the default username and password in that file
-        self.username = "your_mongodb_username"
-        self.password = "your_mongodb_password"
-        self.url = "your_mongodb_url:your_port"
         self.database = database
         self.collection = collection
-        self.server = MongoClient(
-            f"mongodb://{self.username}:{self.password}@{self.url}",
-            serverSelectionTimeoutMS=2000,
-        )
-        self.server.server_info()
+        self.server = get_client(uri, ping=True)
         self.client = self.server[database][collection]
@@ -0,0 +1,73 @@
+import re
+from collections import Counter
+
+# A bracket group of numbers, commas, whitespace and hyphens/en dashes, e.g.
+# "[3]", "[1, 4-6]", "[10 - 12]"
+CITE_GROUP = re.compile(r"\[([\d,\s\-–]+)\]")
+CITE_RANGE_DASH = re.compile(r"\s*[\-–]\s*")
+CITE_SEPARATOR = re.compile(r"[,\s]+")
+CITE_ITEM = re.compile(r"(\d+)(?:-(\d+))?")
+
+
+class citation_scanner:
+    """Single-pass scanner for numeric citation markers.
+
+    The whole document is scanned once with precompiled patterns. Each bracket
+    group is parsed into single citations and ranges, and accepted only if it
+    looks like a citation:
+      - every item is a number or a "start-end" range,
+      - every number is in [1, max_ref] when the number of references is known,
+      - ranges are increasing and span at most max_range references.
+    Groups such as "[0, 1]" or "[1-2-3]", or "[16, 512]" in a paper with 40
+    references, are numeric ranges/values rather than citations and are
+    rejected.
+    """
+
+    def __init__(self, max_ref=None, max_range=50):
+        self.max_ref = max_ref
+        self.max_range = max_range
+
+    def parse_group(self, group):
+        """Return the list of cited reference numbers, or None if not a citation."""
+        group = CITE_RANGE_DASH.sub("-", group.strip())
+        cited = []
+        for item in CITE_SEPARATOR.split(group):
+            if item == "":
+                continue
+            m = CITE_ITEM.fullmatch(item)
+            if not m:
+                return None
+            start = int(m.group(1))
+            end = int(m.group(2)) if m.group(2) else start
+            if start < 1 or end < start or end - start > self.max_range:
+                return None
+            if self.max_ref and end > self.max_ref:
+                return None
+            cited.extend(range(start, end + 1))
+        if len(cited) == 0:
+            return None
+        return cited
+
+    def scan(self, text):
+        """Return (citations, rejected, counts) for a document text.
+
+        citations and rejected are the raw bracket groups accepted and rejected,
+        counts maps each cited reference number to its number of citations.
+        """
+        citations = []
+        rejected = []
+        counts = Counter()
+        for m in CITE_GROUP.finditer(text):
+            cited = self.parse_group(m.group(1))
+            if cited is None:
+                rejected.append(m.group(0))
+                continue
+            citations.append(m.group(0))
+            counts.update(cited)
+        return citations, rejected, dict(counts)
+
+
+def count_citations(pages, max_ref=None):
+    """Count citations over the pages of a document, see citation_scanner."""
+    text = " ".join(pages)
+    return citation_scanner(max_ref).scan(text)
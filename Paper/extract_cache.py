@@ -0,0 +1,68 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+
+def file_digest(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class extract_cache:
+    """On-disk cache of PDF extraction results, keyed by the SHA-256 of the
+    PDF and the extractor version.
+
+    Each entry is one JSON file holding the pdftotext pages, the raw citation
+    markers, the citation counts and the raw refextract output.
+    """
+
+    def __init__(self, cache_dir, version):
+        self.logger = logging.getLogger("extract_cache")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, digest):
+        return self.cache_dir / digest[:2] / f"{digest}-v{self.version}.json"
+
+    def get(self, digest):
+        entry_file = self.path(digest)
+        if not entry_file.exists():
+            self.misses += 1
+            return None
+        try:
+            with open(entry_file, "r") as f:
+                entry = json.load(f)
+        except json.JSONDecodeError:
+            self.logger.warning(f"Ignoring corrupted cache entry {entry_file}")
+            self.misses += 1
+            return None
+        # JSON object keys are strings, citation ids are ints
+        entry["ref_count"] = {int(k): v for k, v in entry["ref_count"].items()}
+        self.hits += 1
+        return entry
+
+    def put(self, digest, pages, cite, ref_count, reference):
+        entry_file = self.path(digest)
+        entry_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = entry_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {
+                    "digest": digest,
+                    "version": self.version,
+                    "pages": pages,
+                    "cite": cite,
+                    "ref_count": ref_count,
+                    "reference": reference,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        tmp_file.replace(entry_file)
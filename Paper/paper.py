@@ -3,13 +3,19 @@ import json
 import logging
 import os
 import re
+import time
+import traceback
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import click
 import pdftotext
 from refextract import extract_references_from_file
 
+from citation import count_citations
+from extract_cache import extract_cache, file_digest
+
 log_format = logging.Formatter(
     "[%(asctime)s][%(filename)s:%(lineno)4s - %(funcName)10s()] %(message)s"
 )
@@ -22,6 +28,11 @@ logging.getLogger().addHandler(handler)
 logging.getLogger().setLevel(logging.INFO)
 
 
+# Bump this when the extraction logic changes, to invalidate cached results
+EXTRACTOR_VERSION = 2
+DEFAULT_CACHE_DIR = str(Path.home() / ".cache" / "mightypc" / "extract")
+
+
 @click.group()
 def paper():
     pass
@@ -51,75 +62,104 @@ def parse_hotcrp_info(paper_path, paper_data):
                 file.rename(file.name)
 
 
-def _extract_single(curr_paper_path, force=False):
+def _count_citations_legacy(ptext):
+    """Count how many times each reference number is cited in the pdf text.
+
+    This is the original page-by-page implementation, superseded by
+    citation.py and kept as the baseline of benchmark-citation.
+    """
+    logger = logging.getLogger()
+    cite = []
+    for ppage in ptext:
+        cpage = re.sub(r"\s+", " ", ppage)
+        cite += re.findall(r"\[[\d\,\-\s]+\]", cpage)
+    ref_count = Counter()
+    for c in cite:
+        cc = c
+        cc = cc.replace("[", "")
+        cc = cc.replace("]", "")
+        cc = re.sub(r"[\,\s]+", " ", cc)
+        for single_cite in cc.split(" "):
+            if single_cite == "":
+                continue
+            try:
+                if "-" in single_cite:
+                    # NOTE: this brings some false positive, for e.g.
+                    #       consider a range represented in submission text [1, 15]
+                    #       this is parsed as citation, but it should be a range
+                    cite_group = single_cite.split("-")
+                    if len(cite_group) != 2:
+                        logger.warning(f"Skipping non-citation entry: [{c}]")
+                        continue
+                    start, end = cite_group
+                    if start == "" or end == "" or int(start) < 0 or int(end) < 0:
+                        logger.warning(f"Skipping non-citation entry: [{c}]")
+                        continue
+                    for i in range(int(start), int(end) + 1):
+                        ref_count[int(i)] += 1
+                else:
+                    if int(single_cite) < 0:
+                        logger.warning(f"Skipping non-citation entry: [{c}]")
+                        continue
+                    ref_count[int(single_cite)] += 1
+            except Exception as e:
+                logger.error(f"Cannot convert to int: [{single_cite}] [{c}]")
+                raise e
+    return cite, dict(ref_count)
+
+
+def _max_linemarker(prefs):
+    """Number of the last entry in the reference list, None if unknown."""
+    markers = []
+    for ref in prefs:
+        if "linemarker" in ref and ref["linemarker"][0].isdigit():
+            markers.append(int(ref["linemarker"][0]))
+    return max(markers) if markers else None
+
+
+def _extract_single(curr_paper_path, force=False, cache_dir=None):
     logger = logging.getLogger()
     file = Path(curr_paper_path)
+    cache = extract_cache(cache_dir, EXTRACTOR_VERSION) if cache_dir else None
     with chdir(file.resolve()):
-        pdata = prefs = ptext = None
+        pdata = None
         data_file = pdf_file = None
         for curr_file in Path(".").iterdir():
             if ".json" in curr_file.name and not pdata:
                 data_file = curr_file
                 with open(curr_file, "r") as f:
                     pdata = json.load(f)
-            elif ".pdf" in curr_file.name and not prefs:
+            elif ".pdf" in curr_file.name and not pdf_file:
                 pdf_file = curr_file.name
-                with open(curr_file, "rb") as f:
-                    ptext = pdftotext.PDF(f)
         if not force and "reference" in pdata:
             logger.info("    Already parsed, skip")
-            return
+            return "skipped"
         else:
             logger.info(f"Parsing [{file.name:>4}]")
-        # Parse reference counts
-        cite = []
-        for ppage in ptext:
-            cpage = re.sub(r"\s+", " ", ppage)
-            cite += re.findall(r"\[[\d\,\-\s]+\]", cpage)
-        ref_count = Counter()
-        for c in cite:
-            cc = c
-            cc = cc.replace("[", "")
-            cc = cc.replace("]", "")
-            cc = re.sub(r"[\,\s]+", " ", cc)
-            for single_cite in cc.split(" "):
-                if single_cite == "":
-                    continue
-                try:
-                    if "-" in single_cite:
-                        # NOTE: this brings some false positive, for e.g.
-                        #       consider a range represented in submission text [1, 15]
-                        #       this is parsed as citation, but it should be a range
-                        cite_group = single_cite.split("-")
-                        if len(cite_group) != 2:
-                            logger.warning(f"Skipping non-citation entry: [{c}]")
-                            continue
-                        start, end = cite_group
-                        if start == "" or end == "" or int(start) < 0 or int(end) < 0:
-                            logger.warning(f"Skipping non-citation entry: [{c}]")
-                            continue
-                        for i in range(int(start), int(end) + 1):
-                            ref_count[int(i)] += 1
-                    else:
-                        if int(single_cite) < 0:
-                            logger.warning(f"Skipping non-citation entry: [{c}]")
-                            continue
-                        ref_count[int(single_cite)] += 1
-                except Exception as e:
-                    logger.error(f"Cannot convert to int: [{single_cite}] [{c}]")
-                    raise e
+        digest = file_digest(pdf_file) if cache else None
+        cached = cache.get(digest) if cache else None
+        if cached:
+            logger.info(f"    Cache hit for PDF digest {digest[:12]}")
+            cite = cached["cite"]
+            ref_count = cached["ref_count"]
+            prefs = cached["reference"]
+        else:
+            with open(pdf_file, "rb") as f:
+                ptext = list(pdftotext.PDF(f))
+            prefs = extract_references_from_file(pdf_file)
+            cite, rejected, ref_count = count_citations(ptext, _max_linemarker(prefs))
+            for r in rejected:
+                logger.warning(f"Skipping non-citation entry: {r}")
+            if cache:
+                cache.put(digest, ptext, cite, ref_count, prefs)
         # Parse reference list
-        ref_count = dict(ref_count)
-        prefs = extract_references_from_file(pdf_file)
         for ref in prefs:
             ref_id = ref["linemarker"][0]
-            try:
-                ref["count"] = ref_count[int(ref_id)]
-            except KeyError as e:
-                logger.error(f"Error parsing paper {file.name}")
-                logger.error(f"Dangling citation id {ref_id}")
-                logger.error(f"Original citations {cite}")
-                raise e
+            # A reference only cited in a rejected group, e.g. "[16, 512]",
+            # has no count, it is kept with 0 instead of failing the paper
+            ref["count"] = ref_count.get(int(ref_id), 0)
+            if ref["count"] == 0:
+                logger.warning(f"    Reference [{ref_id}] is never cited")
             # Fix reference title if not parsed
             if "title" not in ref:
                 title = ""
@@ -165,15 +205,40 @@ def _extract_single(curr_paper_path, force=False):
                 ref["title"] = [title]
         # Update result
         pdata["reference"] = prefs
-        with open(data_file, "w") as f:
-            json.dump(pdata, f, ensure_ascii=False, indent=4)
+        dump_json_atomic(pdata, data_file)
+        return "cached" if cached else "parsed"
+
+
+def dump_json_atomic(data, data_file):
+    """Write to a temporary file first, so an interrupted run never leaves a
+    truncated data file behind."""
+    # NOTE: the temporary name must not contain ".json", other commands pick
+    #       the data file of a paper by that substring
+    tmp_file = Path(data_file).with_suffix(".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    tmp_file.replace(data_file)
+
+
+def _extract_worker(curr_paper_path, force=False, cache_dir=None):
+    """Run _extract_single and report failures instead of raising them."""
+    try:
+        status = _extract_single(curr_paper_path, force, cache_dir)
+        return curr_paper_path, status, None
+    except Exception:
+        return curr_paper_path, "failed", traceback.format_exc()
 
 
 @paper.command()
 @click.argument("curr_paper_path")
 @click.option("-f", "--force", is_flag=True)
-def extract_single(curr_paper_path, force):
-    _extract_single(curr_paper_path, force)
+@click.option("-c", "--cache_dir", default=DEFAULT_CACHE_DIR, show_default=True)
+@click.option("--no_cache", is_flag=True)
+def extract_single(curr_paper_path, force, cache_dir, no_cache):
+    # _extract_single works in the paper directory, a relative cache_dir
+    # must be resolved before
+    cache_dir = None if no_cache else str(Path(cache_dir).resolve())
+    _extract_single(curr_paper_path, force, cache_dir)
 
 
 @paper.command()
@@ -191,18 +256,135 @@ def clear_single(curr_paper_path):
                     logger.info(
                         f'Clear "reference" field in data file {curr_file.name}'
                     )
-                    with open(curr_file, "w") as f:
-                        json.dump(pdata, f, ensure_ascii=False, indent=4)
+                    dump_json_atomic(pdata, curr_file)
 
 
 @paper.command()
 @click.argument("paper_path")
-def extract_reference(paper_path):
-    with chdir(paper_path):
-        for file in Path(".").iterdir():
-            if not file.is_dir():
-                continue
-            _extract_single(file)
+@click.option("-j", "--jobs", type=int, default=1, help="Number of worker processes")
+@click.option("-f", "--force", is_flag=True)
+@click.option("-c", "--cache_dir", default=DEFAULT_CACHE_DIR, show_default=True)
+@click.option("--no_cache", is_flag=True)
+def extract_reference(paper_path, jobs, force, cache_dir, no_cache):
+    logger = logging.getLogger()
+    cache_dir = None if no_cache else str(Path(cache_dir).resolve())
+    paths = [str(p.resolve()) for p in Path(paper_path).iterdir() if p.is_dir()]
+    paths.sort()
+    status = Counter()
+    failed = dict()
+    start = time.perf_counter()
+
+    def collect(res):
+        path, curr_status, error = res
+        status[curr_status] += 1
+        if error:
+            failed[Path(path).name] = error
+            logger.error(f"Failed to parse [{Path(path).name:>4}]:\n{error}")
+        done = sum(status.values())
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Progress [{done:>4}/{len(paths):>4}], {elapsed:.1f}s, "
+            f"{done / elapsed:.2f} papers/s"
+        )
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(_extract_worker, p, force, cache_dir) for p in paths
+            ]
+            for future in as_completed(futures):
+                collect(future.result())
+    else:
+        for p in paths:
+            collect(_extract_worker(p, force, cache_dir))
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Summary: [{status['parsed']}] parsed, [{status['cached']}] from cache, "
+        f"[{status['skipped']}] skipped, [{status['failed']}] failed, "
+        f"{elapsed:.1f}s with [{jobs}] jobs"
+    )
+    if cache_dir:
+        logger.info(
+            f"Extraction cache: [{status['cached']}] hits, "
+            f"[{status['parsed']}] misses"
+        )
+    if len(failed) > 0:
+        logger.error(f"Failed papers: {', '.join(sorted(failed.keys()))}")
+
+
+@paper.command()
+@click.argument("paper_path")
+@click.option("-c", "--cache_dir", default=DEFAULT_CACHE_DIR, show_default=True)
+@click.option("-r", "--repeat", type=int, default=5)
+def benchmark_citation(paper_path, cache_dir, repeat):
+    """
+    Compare the citation counter in citation.py with the legacy one on the
+    text of real submissions. Texts are taken from the extraction cache when
+    available, and from pdftotext otherwise.
+    """
+    logger = logging.getLogger()
+    cache = extract_cache(cache_dir, EXTRACTOR_VERSION)
+    corpus = []
+    for file in sorted(Path(paper_path).iterdir()):
+        if not file.is_dir():
+            continue
+        for pdf_file in file.glob("*.pdf"):
+            entry = cache.get(file_digest(pdf_file))
+            if entry:
+                pages = entry["pages"]
+            else:
+                with open(pdf_file, "rb") as f:
+                    pages = list(pdftotext.PDF(f))
+            corpus.append((file.name, pages))
+    counters = [
+        ("legacy", lambda pages: _count_citations_legacy(pages)[1]),
+        ("scanner", lambda pages: count_citations(pages)[2]),
+    ]
+    # Papers either counter fails on are left out of both the timing and the
+    # comparison
+    counts = {name: dict() for name, _ in counters}
+    failed = set()
+    for pid, pages in corpus:
+        for name, counter in counters:
+            try:
+                counts[name][pid] = counter(pages)
+            except Exception as e:
+                logger.warning(f"Paper [{pid:>4}] {name} counter failed: {e}")
+                failed.add(pid)
+    corpus = [(pid, pages) for pid, pages in corpus if pid not in failed]
+    total_chars = sum(sum(len(p) for p in pages) for _, pages in corpus)
+    logger.info(
+        f"Corpus: [{len(corpus)}] papers, [{total_chars}] characters, "
+        f"[{len(failed)}] skipped"
+    )
+    if len(corpus) == 0 or total_chars == 0:
+        logger.error("No paper to benchmark")
+        return
+
+    logging.getLogger().setLevel(logging.ERROR)
+    timing = dict()
+    for name, counter in counters:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _, pages in corpus:
+                counter(pages)
+            best = min(best, time.perf_counter() - start)
+        timing[name] = best
+    logging.getLogger().setLevel(logging.INFO)
+
+    diff = 0
+    for pid, _ in corpus:
+        if counts["legacy"][pid] != counts["scanner"][pid]:
+            diff += 1
+            logger.debug(f"Paper [{pid:>4}] has different citation counts")
+    for name, t in timing.items():
+        logger.info(
+            f"{name:>8}: {t:.3f}s, {total_chars / t / 1e6:.1f} M chars/s (best of {repeat})"
+        )
+    logger.info(f" speedup: {timing['legacy'] / timing['scanner']:.2f}x")
+    logger.info(f"Papers with different counts (without max_ref): [{diff}]")
 
 
 @paper.command()
@@ -1,12 +1,22 @@
 import click
 import csv
+import inspect
 import json
 import logging
-from fuzzywuzzy import fuzz
+import os
+import sys
 from collections import defaultdict
 from prettytable import PrettyTable
 from dateutil.parser import parse as parse_time
 
+# To import a module from parent dir
+# https://stackoverflow.com/questions/714063/importing-modules-from-parent-folder
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+from Utils.names import rank_names
+
 log_format = logging.Formatter(
     "[%(asctime)s][%(filename)s:%(lineno)4s - %(funcName)10s()] %(message)s"
 )
@@ -342,12 +352,7 @@ def check_no_response(survey_file, member_file, cnt_fuzzy_results, fuzzy_ratio):
                 f"Resp candidate {i}" for i in range(cnt_fuzzy_results)
             ]
         for m in no_response_members:
-            candidates = []
-            for c in all_response:
-                r = fuzz.ratio(m.lower(), c.lower())
-                if r > fuzzy_ratio:
-                    candidates.append({"name": c, "ratio": r})
-            candidates.sort(key=lambda x: x["ratio"], reverse=True)
+            candidates = rank_names(m, all_response, fuzzy_ratio)
             if "email" in member[0].keys():
                 email = ""
                 for origin_member in member:
@@ -355,18 +360,11 @@ def check_no_response(survey_file, member_file, cnt_fuzzy_results, fuzzy_ratio):
                         email = origin_member["email"]
                 report.add_row(
                     [m, email]
-                    + [
-                        f'{c["name"]}({c["ratio"]})'
-                        for c in candidates[:cnt_fuzzy_results]
-                    ]
+                    + [f"{c}({r})" for c, r in candidates[:cnt_fuzzy_results]]
                 )
             else:
                 report.add_row(
-                    [m]
-                    + [
-                        f'{c["name"]}({c["ratio"]})'
-                        for c in candidates[:cnt_fuzzy_results]
-                    ]
+                    [m] + [f"{c}({r})" for c, r in candidates[:cnt_fuzzy_results]]
                 )
         report.align = "l"
         logger.info("\n" + report.get_string(title="Members not responded yet"))
@@ -379,18 +377,9 @@ def check_no_response(survey_file, member_file, cnt_fuzzy_results, fuzzy_ratio):
         name_to_remove = []
         for name in all_response:
             if name not in all_member_names:
-                candidates = []
-                for c in all_member_names:
-                    r = fuzz.ratio(name.lower(), c.lower())
-                    if r > fuzzy_ratio:
-                        candidates.append({"name": c, "ratio": r})
-                candidates.sort(key=lambda x: x["ratio"], reverse=True)
+                candidates = rank_names(name, all_member_names, fuzzy_ratio)
                 report.add_row(
-                    [name]
-                    + [
-                        f'{c["name"]}({c["ratio"]})'
-                        for c in candidates[:cnt_fuzzy_results]
-                    ]
+                    [name] + [f"{c}({r})" for c, r in candidates[:cnt_fuzzy_results]]
                 )
                 name_to_remove.append(name)
         report.align = "l"
@@ -0,0 +1,130 @@
+import atexit
+import functools
+import logging
+import os
+import pickle
+import re
+import unicodedata
+from pathlib import Path
+
+from fuzzywuzzy import fuzz
+
+# Canonical forms and similarity scores of author names are memoized in an LRU
+# cache. Similarity scores are also kept on disk, for at most
+# MAX_CACHED_SCORES name pairs, the most recent ones, so identical names are
+# not scored again in later runs. The on-disk cache is at MIGHTYPC_NAME_CACHE,
+# set it to an empty string to disable it. Canonical forms are cheaper to
+# compute again than to load.
+DEFAULT_CACHE_FILE = str(Path.home() / ".cache" / "mightypc" / "names.pkl")
+MAX_CACHED_SCORES = 100000
+
+# WRatio also scores reordered and partial names, e.g. "Smith, John"
+SCORERS = {"ratio": fuzz.ratio, "wratio": fuzz.WRatio}
+
+# DBLP homonym suffix, e.g. "Wei Wang 0001"
+DBLP_SUFFIX = re.compile(r"\s+\d{4}$")
+BIB_AUTHOR_SEPARATOR = re.compile(r"\s+and\s+")
+
+_scores = None
+_dirty = False
+
+
+def _persistent():
+    """Load the on-disk scores on first use, and save them at exit."""
+    global _scores
+    if _scores is None:
+        _scores = dict()
+        cache_file = os.environ.get("MIGHTYPC_NAME_CACHE", DEFAULT_CACHE_FILE)
+        if cache_file and Path(cache_file).exists():
+            try:
+                with open(cache_file, "rb") as f:
+                    _scores.update(pickle.load(f))
+            except (pickle.UnpicklingError, EOFError):
+                logging.getLogger("names").warning(
+                    f"Ignoring corrupted name cache {cache_file}"
+                )
+        if cache_file:
+            atexit.register(save_cache, cache_file)
+    return _scores
+
+
+def save_cache(cache_file):
+    if not _dirty:
+        return
+    # Dicts keep insertion order, new scores are last
+    scores = dict(list(_scores.items())[-MAX_CACHED_SCORES:])
+    Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+    # One temporary file per process, concurrent runs do not clobber each other
+    tmp_file = Path(f"{cache_file}.{os.getpid()}.tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(scores, f)
+    tmp_file.replace(cache_file)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def canonical_name(name):
+    """Lowercase, strip accents, punctuation and the DBLP homonym suffix,
+    collapse whitespace: "José  García-López 0002" -> "jose garcia lopez"."""
+    n = DBLP_SUFFIX.sub("", name.strip())
+    n = unicodedata.normalize("NFKD", n)
+    n = "".join(c for c in n if not unicodedata.combining(c))
+    n = re.sub(r"[^\w\s]", " ", n.lower())
+    n = re.sub(r"\s+", " ", n).strip()
+    return n
+
+
+def initials(canonical):
+    """Reduce the given names of a canonical name to initials:
+    "john r smith" -> "j r smith"."""
+    tokens = canonical.split()
+    return " ".join([t[0] for t in tokens[:-1]] + tokens[-1:])
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def name_similarity(a, b, scorer="ratio"):
+    """Score of the canonical forms of two names with one of SCORERS, in
+    [0, 100]. If either name starts with an initial, e.g. "J. Smith", the
+    given names of both are also compared as initials, so it scores 100
+    against "John Smith"."""
+    global _dirty
+    key = (scorer, canonical_name(a), canonical_name(b))
+    scores = _persistent()
+    if key in scores:
+        return scores[key]
+    score = SCORERS[scorer](*key[1:])
+    if any(len(n.split()) > 1 and len(n.split()[0]) == 1 for n in key[1:]):
+        score = max(score, SCORERS[scorer](initials(key[1]), initials(key[2])))
+    scores[key] = score
+    _dirty = True
+    return score
+
+
+def rank_names(name, candidates, score_cutoff=0):
+    """Return [(candidate, score)] with score > score_cutoff, best first."""
+    res = []
+    for c in candidates:
+        score = name_similarity(name, c)
+        if score > score_cutoff:
+            res.append((c, score))
+    res.sort(key=lambda x: x[1], reverse=True)
+    return res
+
+
+def best_match(name, candidates, score_cutoff=0):
+    """Return (candidate, score) of the most similar name, or None if no
+    candidate scores at least score_cutoff."""
+    best = None
+    for c in candidates:
+        score = name_similarity(name, c)
+        if score >= score_cutoff and (best is None or score > best[1]):
+            best = (c, score)
+    return best
+
+
+def split_bib_authors(authors):
+    """Split a bibtex author field, "A and\\nB and\\nC", into clean names."""
+    return [
+        re.sub(r"\s+", " ", a).strip()
+        for a in BIB_AUTHOR_SEPARATOR.split(authors.strip())
+        if a.strip()
+    ]
@@ -24,3 +24,15 @@ def chdir(path):
         yield
     finally:
         os.chdir(prev_cwd)
+
+
+def option_group(*options):
+    """Decorator applying several click options at once, in the given order,
+    for options shared by several commands."""
+
+    def decorator(func):
+        for option in reversed(options):
+            func = option(func)
+        return func
+
+    return decorator